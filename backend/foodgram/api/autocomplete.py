@@ -0,0 +1,59 @@
+"""Поиск ингредиентов по названию без обращения к базе данных."""
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from recipes.models import Ingredients
+
+
+class IngredientsIndex:
+    """
+    Отсортированный по названию список ингредиентов в памяти процесса.
+    Совпадения по началу названия ищутся двоичным поиском, за ними
+    следуют совпадения по подстроке.
+    """
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._data = None
+
+    def _load(self):
+        ingredients = sorted(
+            Ingredients.objects.all(), key=lambda item: item.name.casefold()
+        )
+        self._data = (
+            [item.name.casefold() for item in ingredients],
+            ingredients,
+            {item.id: item for item in ingredients},
+            time.monotonic(),
+        )
+        return self._data
+
+    def _get(self):
+        data = self._data
+        if data is not None and not (
+            self.ttl and time.monotonic() - data[3] > self.ttl
+        ):
+            return data
+        return self._load()
+
+    def invalidate(self):
+        self._data = None
+
+    def search(self, query):
+        keys, ingredients, _, _ = self._get()
+        query = query.strip().casefold()
+        if not query:
+            return list(ingredients)
+        start = end = bisect_left(keys, query)
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        return ingredients[start:end] + [
+            ingredient for key, ingredient in zip(keys, ingredients)
+            if query in key and not key.startswith(query)
+        ]
+
+    def get(self, pk):
+        return self._get()[2].get(pk)
+
+
+ingredients_index = IngredientsIndex(ttl=settings.INGREDIENTS_INDEX_TTL)
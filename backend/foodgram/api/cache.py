@@ -0,0 +1,37 @@
+"""
+Кэш ответов API для анонимных пользователей.
+
+Ключ строится по адресу запроса и версии группы данных (рецепты, теги,
+ингредиенты). При изменении данных версия группы меняется, и все ранее
+сохранённые ответы группы перестают использоваться.
+"""
+import hashlib
+import uuid
+
+from django.core.cache import cache
+
+
+def _version_key(group):
+    return f'api:{group}:version'
+
+
+def get_version(group):
+    key = _version_key(group)
+    cache.add(key, uuid.uuid4().hex, None)
+    return cache.get(key, '')
+
+
+def invalidate(*groups):
+    for group in groups:
+        cache.set(_version_key(group), uuid.uuid4().hex, None)
+
+
+def response_cache_key(request, group):
+    query = '&'.join(sorted(
+        f'{name}={value}'
+        for name in request.query_params
+        for value in request.query_params.getlist(name)
+    ))
+    url = f'{request.get_host()}{request.path}?{query}'
+    digest = hashlib.md5(url.encode('utf-8')).hexdigest()
+    return f'api:{group}:{get_version(group)}:response:{digest}'
@@ -1,6 +1,6 @@
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Recipes, Tags
-from rest_framework.filters import SearchFilter
+from recipes.models import POPULAR_ORDERING, Recipes, Tags
+from recipes.search import search_recipes
 from rest_framework.permissions import IsAuthenticated
 from users.models import User
 
@@ -11,7 +11,10 @@ class RecipesFilters(FilterSet):
     1) по тегам
     2) по автору
     3) по вхождению рецепта в число избранных рецептов
-    4) по вхождению рецепта в список покупок.
+    4) по вхождению рецепта в список покупок
+    5) полнотекстовый поиск по названию, ингредиентам и описанию.
+    Параметр ordering=popular сортирует рецепты по числу добавлений
+    в избранное и в списки покупок.
     """
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
@@ -25,6 +28,11 @@ class RecipesFilters(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'popular'),),
+        method='filter_ordering'
+    )
 
     def filter_is_favorited(self, queryset, name, value):
         if value and IsAuthenticated:
@@ -36,11 +44,17 @@ class RecipesFilters(FilterSet):
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
 
-    class Meta:
-        model = Recipes
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+    def filter_search(self, queryset, name, value):
+        if value.strip():
+            return search_recipes(queryset, value)
+        return queryset
 
+    def filter_ordering(self, queryset, name, value):
+        if value == 'popular':
+            return queryset.order_by(*POPULAR_ORDERING)
+        return queryset
 
-class IngredientsFilters(SearchFilter):
-    """Поиск игредиентов по наименованию."""
-    search_param = 'name'
+    class Meta:
+        model = Recipes
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ordering')
@@ -0,0 +1,174 @@
+import json
+import math
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Recipes, Tags
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, percent):
+    """Процентиль по методу ближайшего ранга."""
+    values = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+class Command(BaseCommand):
+    help = ('Измеряет время ответа и число SQL-запросов основных '
+            'эндпоинтов API через тестовый клиент Django. Результат '
+            'сохраняется в JSON; с --compare сравнивается с базовым.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Число замеров на эндпоинт.')
+        parser.add_argument('--warmup', type=int, default=3,
+                            help='Число запросов перед замерами.')
+        parser.add_argument('--user', help='Логин пользователя, от имени '
+                            'которого выполняются запросы; по умолчанию '
+                            'пользователь с наибольшим числом подписок.')
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кэш перед каждым запросом.')
+        parser.add_argument('--output', help='Файл для сохранения '
+                            'результатов (базовой линии).')
+        parser.add_argument('--compare', help='Файл базовой линии для '
+                            'сравнения.')
+        parser.add_argument('--threshold', type=float, default=20,
+                            help='Допустимый рост времени ответа, %%.')
+
+    def get_user(self, username):
+        users = User.objects.all()
+        if username:
+            users = users.filter(username=username)
+        user = users.annotate(
+            follows=Count('follower')
+        ).order_by('-follows').first()
+        if user is None:
+            raise CommandError('Пользователь не найден: запустите '
+                               'generate_data или укажите --user.')
+        return user
+
+    def get_endpoints(self):
+        recipe = Recipes.objects.order_by('-pub_date').first()
+        if recipe is None:
+            raise CommandError('Нет рецептов: запустите generate_data.')
+        tag = Tags.objects.first()
+        endpoints = [
+            ('recipes.list.anonymous', '/api/recipes/', False),
+            ('recipes.list', '/api/recipes/', True),
+            ('recipes.list.cursor', '/api/recipes/?cursor=&limit=20', True),
+            ('recipes.retrieve', f'/api/recipes/{recipe.pk}/', True),
+            ('recipes.search',
+             '/api/recipes/?search=%D1%81%D1%83%D0%BF', True),
+            ('recipes.popular', '/api/recipes/?ordering=popular', True),
+            ('recipes.trending', '/api/recipes/trending/', True),
+            ('recipes.feed', '/api/recipes/feed/?limit=20', True),
+            ('users.subscriptions',
+             '/api/users/subscriptions/?recipes_limit=3', True),
+            ('recipes.download_shopping_cart.txt',
+             '/api/recipes/download_shopping_cart/?format=txt', True),
+            ('recipes.download_shopping_cart.pdf',
+             '/api/recipes/download_shopping_cart/?format=pdf', True),
+        ]
+        if tag is not None:
+            endpoints.append(('recipes.list.tags',
+                              f'/api/recipes/?tags={tag.slug}', True))
+        return endpoints
+
+    def measure(self, client, url, options):
+        if options['cold']:
+            cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = client.get(url)
+            if response.streaming:
+                size = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                size = len(response.content)
+            elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise CommandError(f'{url}: ответ {response.status_code}')
+        return elapsed * 1000, len(context.captured_queries), size
+
+    def run(self, options):
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        clients = {
+            False: Client(),
+            True: Client(HTTP_AUTHORIZATION=f'Token {token.key}'),
+        }
+        results = {}
+        for name, url, authenticated in self.get_endpoints():
+            client = clients[authenticated]
+            for _ in range(options['warmup']):
+                self.measure(client, url, options)
+            samples = [self.measure(client, url, options)
+                       for _ in range(options['requests'])]
+            latencies = [sample[0] for sample in samples]
+            results[name] = {
+                'url': url,
+                'mean_ms': round(statistics.mean(latencies), 2),
+                **{f'p{percent}_ms': round(percentile(latencies, percent), 2)
+                   for percent in PERCENTILES},
+                'queries': max(sample[1] for sample in samples),
+                'bytes': samples[-1][2],
+            }
+            self.stdout.write(
+                f'{name:40} ' + ' '.join(
+                    f'p{percent}={results[name][f"p{percent}_ms"]:.1f}мс'
+                    for percent in PERCENTILES
+                ) + f' запросов={results[name]["queries"]}'
+            )
+        return {'user': user.username, 'requests': options['requests'],
+                'endpoints': results}
+
+    def compare(self, current, baseline, threshold):
+        regressions = []
+        for name, result in current['endpoints'].items():
+            base = baseline['endpoints'].get(name)
+            if base is None:
+                continue
+            for metric in ('p50_ms', 'p90_ms'):
+                limit = base[metric] * (1 + threshold / 100)
+                if result[metric] > limit:
+                    regressions.append(
+                        f'{name}: {metric} {result[metric]:.1f} > '
+                        f'{base[metric]:.1f} (+{threshold:g}%)'
+                    )
+            if result['queries'] > base['queries']:
+                regressions.append(
+                    f'{name}: запросов {result["queries"]} > {base["queries"]}'
+                )
+        return regressions
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as error:
+                raise CommandError(
+                    f'Не удалось прочитать базовую линию: {error}'
+                ) from error
+        current = self.run(options)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(current, f, ensure_ascii=False, indent=2)
+        if baseline is None:
+            return
+        regressions = self.compare(current, baseline, options['threshold'])
+        if regressions:
+            for regression in regressions:
+                self.stderr.write(regression)
+            raise CommandError(f'Регрессий: {len(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
@@ -0,0 +1,96 @@
+import statistics
+import time
+
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.db.utils import load_backend
+from django.test.client import Client
+from foodgram.db.pool import pool_stats
+from rest_framework.authtoken.models import Token
+
+from ...middleware import opened_connections
+from .benchmark_api import PERCENTILES
+from .benchmark_api import Command as BenchmarkCommand
+from .benchmark_api import percentile
+
+POSTGRESQL = 'foodgram.db.postgresql'
+# Режим: бэкенд и CONN_MAX_AGE.
+MODES = {
+    'new': (POSTGRESQL, 0),
+    'persistent': (POSTGRESQL, 600),
+    'pooled': ('foodgram.db.pooled', 0),
+}
+
+
+class Command(BenchmarkCommand):
+    help = ('Сравнивает время ответа ленты подписок при новом соединении '
+            'на каждый запрос, постоянных соединениях (CONN_MAX_AGE) '
+            'и пуле соединений. Нужна PostgreSQL с данными generate_data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Число запросов в каждом режиме.')
+        parser.add_argument('--user', help='Логин пользователя; по '
+                            'умолчанию с наибольшим числом подписок.')
+        parser.add_argument('--url', default='/api/recipes/feed/?limit=10')
+        parser.add_argument('--modes', nargs='*', choices=MODES,
+                            default=list(MODES))
+
+    def use(self, engine, max_age):
+        """Заменяет соединение default соединением в нужном режиме."""
+        connections[DEFAULT_DB_ALIAS].close()
+        settings_dict = dict(self.settings_dict, ENGINE=engine,
+                             CONN_MAX_AGE=max_age)
+        connections[DEFAULT_DB_ALIAS] = load_backend(
+            engine
+        ).DatabaseWrapper(settings_dict, DEFAULT_DB_ALIAS)
+
+    def request(self, client, url):
+        # Тестовый клиент не закрывает соединения после запроса,
+        # поэтому это делается здесь, как в WSGI-сервере.
+        close_old_connections()
+        start = time.perf_counter()
+        response = client.get(url)
+        finish = time.perf_counter()
+        close_old_connections()
+        if response.status_code != 200:
+            raise CommandError(f'{url}: ответ {response.status_code}')
+        return (finish - start) * 1000
+
+    @staticmethod
+    def pool_opened():
+        stats = pool_stats().get(DEFAULT_DB_ALIAS)
+        return stats and stats['opened']
+
+    def handle(self, *args, **options):
+        original = connections[DEFAULT_DB_ALIAS]
+        if original.vendor != 'postgresql':
+            raise CommandError('Сравнение имеет смысл только для '
+                               'PostgreSQL.')
+        self.settings_dict = original.settings_dict
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        try:
+            for mode in options['modes']:
+                self.use(*MODES[mode])
+                self.request(client, options['url'])
+                opened, pooled = opened_connections(), self.pool_opened()
+                latencies = [self.request(client, options['url'])
+                             for _ in range(options['requests'])]
+                line = (
+                    f'{mode:12} среднее={statistics.mean(latencies):.2f}мс '
+                    + ' '.join(
+                        f'p{percent}={percentile(latencies, percent):.2f}мс'
+                        for percent in PERCENTILES
+                    )
+                    + f' соединений={opened_connections() - opened}'
+                )
+                if pooled is not None:
+                    # Django получает соединение из пула на каждый запрос,
+                    # по-настоящему открываются только новые соединения пула.
+                    line += f' открыто пулом={self.pool_opened() - pooled}'
+                self.stdout.write(line)
+        finally:
+            connections[DEFAULT_DB_ALIAS].close()
+            connections[DEFAULT_DB_ALIAS] = original
@@ -0,0 +1,95 @@
+import re
+
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from .benchmark_api import Command as BenchmarkCommand
+
+# Последовательное чтение таблицы в плане PostgreSQL и SQLite.
+SEQ_SCAN_RE = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$'),
+}
+EXPLAIN = {
+    'postgresql': 'EXPLAIN ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+
+
+class Command(BenchmarkCommand):
+    help = ('Выполняет EXPLAIN для SQL-запросов основных эндпоинтов API '
+            'и сообщает о последовательном чтении таблиц. Запускать '
+            'на наборе данных, созданном generate_data: на маленьких '
+            'таблицах последовательное чтение выгоднее индекса.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Логин пользователя, от имени '
+                            'которого выполняются запросы.')
+        # Справочники читаются целиком при hash join, и это быстрее индекса.
+        parser.add_argument('--ignore', nargs='*',
+                            default=['recipes_tags', 'recipes_ingredients'],
+                            help='Таблицы, чтение которых не учитывается.')
+        parser.add_argument('--fail', action='store_true',
+                            help='Завершаться с ошибкой, если найдено '
+                                 'последовательное чтение.')
+
+    def capture(self, client, url):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        if response.status_code != 200:
+            raise CommandError(f'{url}: ответ {response.status_code}')
+        return [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].lstrip().upper().startswith('SELECT')
+        ]
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(EXPLAIN[connection.vendor] + sql)
+            return [str(row[-1]) for row in cursor.fetchall()]
+
+    def handle(self, *args, **options):
+        if connection.vendor not in EXPLAIN:
+            raise CommandError(f'СУБД {connection.vendor} не поддерживается.')
+        pattern = SEQ_SCAN_RE[connection.vendor]
+        # Подзапросы в плане SQLite тоже «читаются», но это не таблицы.
+        tables = set(connection.introspection.table_names())
+        tables.difference_update(options['ignore'])
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        clients = {
+            False: Client(),
+            True: Client(HTTP_AUTHORIZATION=f'Token {token.key}'),
+        }
+        flagged = 0
+        for name, url, authenticated in self.get_endpoints():
+            statements = self.capture(clients[authenticated], url)
+            scans = []
+            for sql in dict.fromkeys(statements):
+                plan = self.explain(sql)
+                scanned = {
+                    match.group(1) for match in map(pattern.search, plan)
+                    if match and match.group(1) in tables
+                }
+                if scanned:
+                    scans.append((sorted(scanned), sql, plan))
+            flagged += len(scans)
+            style = self.style.WARNING if scans else self.style.SUCCESS
+            self.stdout.write(style(
+                f'{name:40} запросов={len(statements)} '
+                f'последовательных чтений={len(scans)}'
+            ))
+            for scan_tables, sql, plan in scans:
+                self.stdout.write(f'  {", ".join(scan_tables)}: {sql[:200]}')
+                if options['verbosity'] > 1:
+                    self.stdout.write('\n'.join(f'    {line}'
+                                                for line in plan))
+        if flagged and options['fail']:
+            raise CommandError(
+                f'Запросов с последовательным чтением: {flagged}'
+            )
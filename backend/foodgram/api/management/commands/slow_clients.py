@@ -0,0 +1,151 @@
+import asyncio
+import base64
+import io
+import json
+import os
+import statistics
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from .benchmark_api import PERCENTILES, percentile
+
+
+def make_upload_body(size):
+    """
+    JSON рецепта с изображением size x size из случайных пикселей.
+    Ингредиентов нет, поэтому сервер отклоняет запрос (400), но только
+    после того, как прочитает тело целиком, и данные не создаются.
+    """
+    image = Image.frombytes('RGB', (size, size), os.urandom(size * size * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return json.dumps({
+        'name': 'slow client', 'text': 'slow client', 'cooking_time': 1,
+        'tags': [], 'ingredients': [],
+        'image': f'data:image/png;base64,{encoded}',
+    }).encode()
+
+
+class Command(BaseCommand):
+    help = ('Имитирует медленных клиентов (загрузка изображения или '
+            'скачивание списка покупок с ограниченной скоростью) и во время '
+            'их работы измеряет время ответа быстрого запроса. Сравнивает '
+            'занятость воркеров при запуске через WSGI и ASGI; сервер '
+            'нужно запустить отдельно.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000',
+                            help='Адрес запущенного сервера.')
+        parser.add_argument('--mode', choices=('upload', 'download'),
+                            default='upload')
+        parser.add_argument('--clients', type=int, default=16,
+                            help='Число медленных клиентов.')
+        parser.add_argument('--rate', type=int, default=8192,
+                            help='Скорость медленного клиента, байт/с.')
+        parser.add_argument('--image-size', type=int, default=300,
+                            help='Сторона изображения в режиме upload.')
+        parser.add_argument('--token', default='',
+                            help='Токен для скачивания списка покупок.')
+        parser.add_argument('--probe', default='/api/tags/',
+                            help='Путь быстрого запроса.')
+        parser.add_argument('--duration', type=float, default=20,
+                            help='Длительность замера, с.')
+        parser.add_argument('--timeout', type=float, default=10,
+                            help='Предельное время быстрого запроса, с.')
+
+    def request_head(self, method, path, length=0):
+        headers = [f'{method} {path} HTTP/1.1', f'Host: {self.host}',
+                   'Connection: close']
+        if self.options['token']:
+            headers.append(f'Authorization: Token {self.options["token"]}')
+        if method == 'POST':
+            headers += ['Content-Type: application/json',
+                        f'Content-Length: {length}']
+        return ('\r\n'.join(headers) + '\r\n\r\n').encode()
+
+    async def open(self):
+        return await asyncio.open_connection(self.host, self.port)
+
+    async def slow_upload(self, body, deadline):
+        reader, writer = await self.open()
+        writer.write(self.request_head('POST', '/api/recipes/', len(body)))
+        step = max(self.options['rate'] // 10, 1)
+        for start in range(0, len(body), step):
+            if time.monotonic() > deadline:
+                break
+            writer.write(body[start:start + step])
+            await writer.drain()
+            await asyncio.sleep(0.1)
+        writer.close()
+
+    async def slow_download(self, deadline):
+        reader, writer = await self.open()
+        writer.write(self.request_head(
+            'GET', '/api/recipes/download_shopping_cart/?format=pdf'
+        ))
+        step = max(self.options['rate'] // 10, 1)
+        while time.monotonic() < deadline:
+            if not await reader.read(step):
+                break
+            await asyncio.sleep(0.1)
+        writer.close()
+
+    async def probe(self, deadline):
+        latencies, failures = [], Counter()
+        while time.monotonic() < deadline:
+            start = time.monotonic()
+            try:
+                reader, writer = await self.open()
+                writer.write(self.request_head('GET', self.options['probe']))
+                status = await asyncio.wait_for(reader.readline(),
+                                                self.options['timeout'])
+                await asyncio.wait_for(reader.read(), self.options['timeout'])
+                writer.close()
+                if b' 200 ' not in status:
+                    raise ValueError(status)
+                latencies.append((time.monotonic() - start) * 1000)
+            except (OSError, ValueError, asyncio.TimeoutError) as error:
+                failures[type(error).__name__] += 1
+            await asyncio.sleep(0.2)
+        return latencies, failures
+
+    async def run(self):
+        options = self.options
+        deadline = time.monotonic() + options['duration']
+        if options['mode'] == 'upload':
+            body = make_upload_body(options['image_size'])
+            self.stdout.write(f'Тело запроса: {len(body)} байт, загрузка '
+                              f'за {len(body) / options["rate"]:.0f} с.')
+            clients = [self.slow_upload(body, deadline)
+                       for _ in range(options['clients'])]
+        else:
+            clients = [self.slow_download(deadline)
+                       for _ in range(options['clients'])]
+        # Медленные клиенты успевают занять воркеры до первых замеров.
+        tasks = [asyncio.ensure_future(client) for client in clients]
+        await asyncio.sleep(1)
+        latencies, failures = await self.probe(deadline)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return latencies, failures
+
+    def handle(self, *args, **options):
+        self.options = options
+        url = urlsplit(options['url'])
+        if not url.hostname:
+            raise CommandError('Укажите адрес сервера в --url.')
+        self.host, self.port = url.hostname, url.port or 80
+        latencies, failures = asyncio.run(self.run())
+        self.stdout.write(f'Быстрых запросов: {len(latencies)}, ошибок: '
+                          f'{sum(failures.values())} {dict(failures)}')
+        if latencies:
+            self.stdout.write(
+                f'Среднее {statistics.mean(latencies):.1f}мс, ' + ' '.join(
+                    f'p{percent}={percentile(latencies, percent):.1f}мс'
+                    for percent in PERCENTILES
+                )
+            )
@@ -0,0 +1,309 @@
+"""
+Метрики API в текстовом формате Prometheus.
+
+Каждый процесс копит значения в памяти и не чаще раза в
+METRICS_FLUSH_INTERVAL секунд сбрасывает их в свой файл в каталоге
+METRICS_DIR. Эндпоинт /api/metrics суммирует файлы всех процессов,
+поэтому при нескольких воркерах WSGI отдаются общие значения.
+Счётчики и гистограммы завершившихся процессов складываются в общий
+файл exited.json, а файлы процессов удаляются: суммы не уменьшаются
+при перезапуске воркеров, каталог не растёт, а новый процесс с тем же
+PID не затирает значения прежнего. Текущие значения (gauge) берутся
+только у работающих процессов.
+Внешний агент или клиентская библиотека не нужны.
+"""
+import hmac
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+try:
+    import fcntl
+except ImportError:  # Windows: без блокировки, для разработки.
+    fcntl = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+EXITED_FILENAME = 'exited.json'
+
+METRICS = {
+    'foodgram_http_requests_total': (
+        'counter', 'Число обработанных запросов.', None),
+    'foodgram_http_request_duration_seconds': (
+        'histogram', 'Время обработки запроса.', LATENCY_BUCKETS),
+    'foodgram_db_queries': (
+        'histogram', 'Число SQL-запросов на один запрос.', QUERY_BUCKETS),
+    'foodgram_cache_requests_total': (
+        'counter', 'Обращения к кэшу ответов API.', None),
+    'foodgram_shopping_list_export_bytes': (
+        'histogram', 'Размер выгруженного списка покупок.', SIZE_BUCKETS),
+    'foodgram_db_connections_opened_total': (
+        'counter', 'Соединения с базой, открытые Django.', None),
+    'foodgram_db_pool_connections': (
+        'gauge', 'Соединения пула: занятые и свободные.', None),
+    'foodgram_db_pool_events_total': (
+        'counter', 'События пула: открытия, выдачи, ожидания.', None),
+}
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path, snapshot):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    os.replace(temporary, path)
+
+
+def _to_snapshot(counters, histograms):
+    return {
+        'counters': [[name, labels, value] for (name, labels), value
+                     in counters.items()],
+        'histograms': [[name, labels, values] for (name, labels), values
+                       in histograms.items()],
+    }
+
+
+def _merge(snapshots, gauges=True):
+    """Суммирует значения процессов; gauges=False отбрасывает gauge."""
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            if not gauges and METRICS[name][0] == 'gauge':
+                continue
+            counters[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, values in snapshot['histograms']:
+            total = histograms.setdefault(
+                (name, tuple(map(tuple, labels))), [0] * len(values)
+            )
+            for index, value in enumerate(values):
+                total[index] += value
+    return counters, histograms
+
+
+@contextmanager
+def _directory_lock():
+    """Не даёт двум процессам одновременно складывать файлы метрик."""
+    with open(os.path.join(settings.METRICS_DIR, '.lock'), 'w') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+class Registry:
+    """Значения метрик текущего процесса с периодическим сбросом в файл."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.flushed_at = 0.0
+        self.claimed = False
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.counters[(name, _key(labels))] += value
+
+    def set(self, name, labels, value):
+        """Значение, которое процесс считает сам (gauge, счётчики пула)."""
+        with self.lock:
+            self.counters[(name, _key(labels))] = value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        with self.lock:
+            histogram = self.histograms.setdefault(
+                (name, _key(labels)), [0] * len(buckets) + [0.0, 0]
+            )
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return _to_snapshot(self.counters, self.histograms)
+
+    @staticmethod
+    def path(pid):
+        return os.path.join(settings.METRICS_DIR, f'{pid}.json')
+
+    @staticmethod
+    def fold(paths):
+        """
+        Добавляет счётчики и гистограммы из файлов завершившихся
+        процессов в общий файл и удаляет эти файлы.
+        """
+        exited = os.path.join(settings.METRICS_DIR, EXITED_FILENAME)
+        with _directory_lock():
+            # Файлы, которые уже сложил другой процесс, прочитать не выйдет.
+            snapshots = [
+                snapshot for snapshot in map(_read, paths)
+                if snapshot is not None
+            ]
+            if not snapshots:
+                return
+            _write(exited, _to_snapshot(*_merge(
+                [_read(exited) or _to_snapshot({}, {})] + snapshots,
+                gauges=False
+            )))
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def maybe_flush(self):
+        now = time.monotonic()
+        if now - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+            self.flushed_at = now
+            self.flush()
+
+    def flush(self):
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = self.path(os.getpid())
+        if not self.claimed:
+            # Файл с тем же PID остался от завершившегося процесса.
+            self.claimed = True
+            if os.path.exists(path):
+                self.fold([path])
+        _write(path, self.snapshot())
+
+    def snapshots(self):
+        """Значения работающих процессов и завершившихся вместе."""
+        yield self.snapshot()
+        if not os.path.isdir(settings.METRICS_DIR):
+            return
+        alive, exited = [], []
+        for filename in os.listdir(settings.METRICS_DIR):
+            pid, extension = os.path.splitext(filename)
+            if (extension != '.json' or not pid.isdigit()
+                    or int(pid) == os.getpid()):
+                continue
+            path = os.path.join(settings.METRICS_DIR, filename)
+            (alive if _is_alive(int(pid)) else exited).append(path)
+        if exited:
+            self.fold(exited)
+        alive.append(os.path.join(settings.METRICS_DIR, EXITED_FILENAME))
+        for snapshot in map(_read, alive):
+            if snapshot is not None:
+                yield snapshot
+
+    def collect(self):
+        """Суммарные значения всех процессов."""
+        return _merge(self.snapshots())
+
+
+registry = Registry()
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(
+        f'{name}="{_escape(value)}"' for name, value in pairs
+    )
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(counters, histograms):
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+        if kind in ('counter', 'gauge'):
+            lines += [
+                f'{name}{_labels(labels)} {_number(value)}'
+                for (metric, labels), value in sorted(counters.items())
+                if metric == name
+            ]
+            continue
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            lines += [
+                f'{name}_bucket{_labels(labels, le=bound)} {count}'
+                for bound, count in zip(buckets, values)
+            ]
+            lines += [
+                f'{name}_bucket{_labels(labels, le="+Inf")} {values[-1]}',
+                f'{name}_sum{_labels(labels)} {_number(values[-2])}',
+                f'{name}_count{_labels(labels)} {values[-1]}',
+            ]
+    lines += ['# HELP foodgram_cache_hit_ratio Доля попаданий в кэш ответов.',
+              '# TYPE foodgram_cache_hit_ratio gauge']
+    cache = defaultdict(dict)
+    for (metric, labels), value in counters.items():
+        if metric == 'foodgram_cache_requests_total':
+            labels = dict(labels)
+            cache[labels['group']][labels['result']] = value
+    for group, results in sorted(cache.items()):
+        total = results.get('hit', 0) + results.get('miss', 0)
+        lines.append(
+            f'foodgram_cache_hit_ratio{_labels([("group", group)])} '
+            f'{_number(results.get("hit", 0) / total if total else 0.0)}'
+        )
+    return '\n'.join(lines) + '\n'
+
+
+def measure_size(chunks, name, labels):
+    """Пропускает части ответа, по окончании учитывая их общий размер."""
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    registry.observe(name, labels, size)
+
+
+def metrics_view(request):
+    """Метрики доступны по METRICS_TOKEN или администратору в сессии."""
+    token = settings.METRICS_TOKEN
+    user = request.user
+    allowed = (
+        token and hmac.compare_digest(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'
+        )
+        or user.is_authenticated and user.is_admin
+    )
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render(*registry.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,175 @@
+"""
+Учёт SQL-запросов и времени обработки каждого запроса.
+
+Включается настройкой QUERY_INSTRUMENTATION. Для каждого запроса
+считаются число SQL-запросов, повторы (одинаковый SQL с одинаковыми
+параметрами) и время в базе. Итог отдаётся в заголовке Server-Timing
+и пишется в журнал api.instrumentation; медленные запросы (с заданной
+долей выборки) журналируются вместе с самыми затратными SQL.
+Запросы, выполняемые при отдаче потокового ответа, не учитываются.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from foodgram.db.pool import STATS, pool_stats
+
+from .metrics import registry
+
+logger = logging.getLogger('api.instrumentation')
+_local = threading.local()
+
+
+@receiver(connection_created)
+def count_connection(**kwargs):
+    """Считает соединения с базой, открытые в текущем потоке."""
+    _local.connections = getattr(_local, 'connections', 0) + 1
+    registry.inc('foodgram_db_connections_opened_total', {})
+
+
+def opened_connections():
+    return getattr(_local, 'connections', 0)
+
+
+class QueryStats:
+    """Статистика SQL-запросов одного HTTP-запроса."""
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.executions = Counter()
+        self.statements = defaultdict(lambda: [0, 0.0])
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            self.executions[(sql, repr(params))] += 1
+            statement = self.statements[sql]
+            statement[0] += 1
+            statement[1] += duration
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.executions.values())
+
+    def top(self, limit):
+        """Самые затратные SQL: текст, число выполнений, время (мс)."""
+        return [
+            {'sql': sql, 'count': count, 'ms': round(duration * 1000, 2)}
+            for sql, (count, duration) in sorted(
+                self.statements.items(), key=lambda item: -item[1][1]
+            )[:limit]
+        ]
+
+
+def get_view_name(view_func, method):
+    """Имя представления вида RecipesViewSet.list."""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__qualname__', repr(view_func))
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{cls.__name__}.{actions.get(method.lower(), method.lower())}'
+
+
+class QueryInstrumentationMiddleware:
+    """Считает SQL-запросы и время ответа каждого запроса."""
+    def __init__(self, get_response):
+        if not settings.QUERY_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        opened = opened_connections()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+        total = (time.perf_counter() - start) * 1000
+        db_time = stats.duration * 1000
+        response['Server-Timing'] = (
+            f'db;dur={db_time:.2f};desc="{stats.count} queries, '
+            f'{stats.duplicates} duplicates", app;dur={total:.2f}'
+        )
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': getattr(request, 'instrumentation_view', None),
+            'status': response.status_code,
+            'duration_ms': round(total, 2),
+            'db_ms': round(db_time, 2),
+            'queries': stats.count,
+            'duplicates': stats.duplicates,
+            'db_connections': opened_connections() - opened,
+        }
+        pools = pool_stats()
+        if pools:
+            record['db_pool'] = pools
+        logger.info(json.dumps(record, ensure_ascii=False),
+                    extra={'request_stats': record})
+        if (total >= settings.SLOW_REQUEST_MS
+                and random.random() < settings.SLOW_REQUEST_SAMPLE_RATE):
+            record['top_queries'] = stats.top(settings.SLOW_REQUEST_TOP_SQL)
+            logger.warning(json.dumps(record, ensure_ascii=False),
+                           extra={'request_stats': record})
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.instrumentation_view = get_view_name(view_func,
+                                                     request.method)
+
+
+class MetricsMiddleware:
+    """Собирает метрики запросов для эндпоинта /api/metrics."""
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(1)
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count))
+            response = self.get_response(request)
+        view = getattr(request, 'instrumentation_view', 'unmatched')
+        registry.inc('foodgram_http_requests_total', {
+            'view': view, 'method': request.method,
+            'status': response.status_code,
+        })
+        registry.observe('foodgram_http_request_duration_seconds',
+                         {'view': view}, time.perf_counter() - start)
+        registry.observe('foodgram_db_queries', {'view': view}, len(queries))
+        for alias, pool in pool_stats().items():
+            for state in ('used', 'idle'):
+                registry.set('foodgram_db_pool_connections',
+                             {'alias': alias, 'state': state}, pool[state])
+            for event in STATS:
+                registry.set('foodgram_db_pool_events_total',
+                             {'alias': alias, 'event': event}, pool[event])
+        registry.maybe_flush()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.instrumentation_view = get_view_name(view_func,
+                                                     request.method)
@@ -1,8 +1,145 @@
-from recipes.models import Recipes
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date, quote_etag
+from recipes.models import (FavoriteRecipes, Recipes, ShoppingCart,
+                            ShoppingCartTotals)
 from rest_framework import mixins, status, viewsets
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 
+from .cache import get_version, response_cache_key
+from .metrics import registry
+from .signals import bump_version
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы для list и retrieve.
+    ETag строится по отметкам версий данных (дата изменения рецептов,
+    счётчики избранного, списка покупок и подписок пользователя), поэтому
+    при совпадении If-None-Match ответ 304 отдаётся без сериализации.
+    """
+    def get_list_stamps(self):
+        """
+        Отметки версий списка: кортеж (дата изменения, *значения)
+        или None, если условные запросы не поддерживаются.
+        """
+
+    def get_object_stamps(self):
+        """Отметки версий объекта в том же виде, что и для списка."""
+
+    def get_recipes_stamps(self):
+        """
+        Отметки всех рецептов: дата последнего изменения (по индексу,
+        без просмотра таблицы) и версия группы кэша recipes, которая
+        меняется и при удалении рецептов.
+        """
+        updated_at = Recipes.objects.aggregate(
+            updated_at=Max('updated_at')
+        )['updated_at']
+        return updated_at, get_version('recipes')
+
+    def get_user_stamps(self):
+        user = self.request.user
+        if user.is_anonymous:
+            return ()
+        return (user.pk, user.favorites_version,
+                user.shopping_cart_version, user.follows_version)
+
+    def conditional_response(self, stamps, handler, request, *args, **kwargs):
+        if stamps is None:
+            return handler(request, *args, **kwargs)
+        last_modified, *values = stamps
+        etag = quote_etag(hashlib.md5(repr((
+            request.accepted_renderer.format, last_modified, values,
+            self.get_user_stamps()
+        )).encode('utf-8')).hexdigest())
+        # Дата изменения не учитывает состояние пользователя, поэтому
+        # Last-Modified отдаётся только анонимным пользователям.
+        timestamp = None
+        if last_modified is not None and request.user.is_anonymous:
+            timestamp = int(last_modified.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_list_stamps(), super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_object_stamps(), super().retrieve,
+            request, *args, **kwargs
+        )
+
+
+class AnonymousCacheMixin:
+    """
+    Кэширует ответы list и retrieve для анонимных пользователей:
+    они одинаковы для всех, повторный запрос не обращается к базе.
+    Вместе с данными сохраняются ETag и Last-Modified, поэтому условный
+    запрос при попадании в кэш тоже обходится без базы. Миксин должен
+    стоять в списке родителей перед ConditionalGetMixin.
+    """
+    cache_group = None
+    cached_headers = ('ETag', 'Last-Modified')
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return handler(request, *args, **kwargs)
+        key = response_cache_key(request, self.cache_group)
+        cached = cache.get(key)
+        registry.inc('foodgram_cache_requests_total', {
+            'group': self.cache_group,
+            'result': 'miss' if cached is None else 'hit',
+        })
+        if cached is not None:
+            return self.response_from_cache(request, *cached)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            headers = {name: response[name] for name in self.cached_headers
+                       if response.has_header(name)}
+            cache.set(key, (response.data, headers),
+                      settings.API_CACHE_TIMEOUT)
+        return response
+
+    def response_from_cache(self, request, data, headers):
+        response = None
+        if 'ETag' in headers:
+            last_modified = headers.get('Last-Modified')
+            response = get_conditional_response(
+                request, etag=headers['ETag'],
+                last_modified=last_modified and parse_http_date(last_modified)
+            )
+        if response is None:
+            response = Response(data)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
 
 class ListRetrieveViewSet(mixins.ListModelMixin,
                           mixins.RetrieveModelMixin,
@@ -11,26 +148,93 @@ class ListRetrieveViewSet(mixins.ListModelMixin,
     pass
 
 
+# Счётчик рецепта, который меняется при добавлении в модель-связку.
+RECIPES_COUNTERS = {
+    FavoriteRecipes: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
 class CustomRecipeViewSet(viewsets.ModelViewSet):
     """Класс для обратботки запросов по рецептам."""
     def adding_object(self, serializers, model, user, pk):
         recipes = get_object_or_404(Recipes, id=pk)
-        if model.objects.filter(user=user, recipes=recipes).exists():
+        try:
+            with transaction.atomic():
+                # Та же блокировка строки пользователя, что и в
+                # adding_objects: иначе рецепт, добавленный здесь между
+                # проверкой и bulk_create, был бы учтён там повторно.
+                bump_version(model, user.pk)
+                instance = model.objects.create(user=user, recipes=recipes)
+                Recipes.objects.filter(pk=recipes.pk).change_counter(
+                    RECIPES_COUNTERS[model], 1
+                )
+                if model is ShoppingCart:
+                    ShoppingCartTotals.objects.add_recipes(user, [recipes])
+        except IntegrityError:
             return Response(
                 f'{recipes} уже есть в {model}',
                 status=status.HTTP_400_BAD_REQUEST
             )
-        model.objects.create(user=user, recipes=recipes)
-        queryset = model.objects.get(user=user, recipes=recipes)
-        serializer = serializers(queryset)
+        serializer = serializers(instance)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def deleting_object(self, model, pk, user):
         recipes = get_object_or_404(Recipes, id=pk)
-        if not model.objects.filter(user=user, recipes=recipes).exists():
+        with transaction.atomic():
+            deleted, _ = model.objects.filter(
+                user=user, recipes=recipes
+            ).delete()
+            if deleted:
+                Recipes.objects.filter(pk=recipes.pk).change_counter(
+                    RECIPES_COUNTERS[model], -1
+                )
+                if model is ShoppingCart:
+                    ShoppingCartTotals.objects.remove_recipes(
+                        user, [recipes]
+                    )
+        if not deleted:
             return Response(
                 f'{recipes} отсутствует в {model}',
                 status=status.HTTP_400_BAD_REQUEST
             )
-        model.objects.get(user=user, recipes=recipes).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def adding_objects(self, serializers, model, user, recipes):
+        """
+        Добавляет рецепты (словарь id -> рецепт) одним bulk_create.
+        Уже добавленные рецепты пропускаются; в ответе только новые.
+        """
+        with transaction.atomic():
+            # bulk_create не отправляет сигналы, поэтому версия меняется
+            # явно; заодно блокируется строка пользователя.
+            bump_version(model, user.pk)
+            existing = set(model.objects.filter(
+                user=user, recipes__in=recipes
+            ).values_list('recipes', flat=True))
+            instances = [model(user=user, recipes=recipes[pk])
+                         for pk in sorted(recipes) if pk not in existing]
+            model.objects.bulk_create(instances, ignore_conflicts=True)
+            added = [instance.recipes_id for instance in instances]
+            Recipes.objects.filter(pk__in=added).change_counter(
+                RECIPES_COUNTERS[model], 1
+            )
+            if model is ShoppingCart:
+                ShoppingCartTotals.objects.add_recipes(user, added)
+        serializer = serializers(instances, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def deleting_objects(self, model, user, recipes):
+        """Удаляет рецепты (словарь id -> рецепт) одним запросом DELETE."""
+        with transaction.atomic():
+            links = model.objects.filter(user=user, recipes__in=recipes)
+            removed = list(links.select_for_update().values_list(
+                'recipes', flat=True
+            ))
+            links.delete()
+            Recipes.objects.filter(pk__in=removed).change_counter(
+                RECIPES_COUNTERS[model], -1
+            )
+            if model is ShoppingCart:
+                ShoppingCartTotals.objects.remove_recipes(user, removed)
         return Response(status=status.HTTP_204_NO_CONTENT)
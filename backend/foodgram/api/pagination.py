@@ -1,7 +1,173 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPageNumberPagination(PageNumberPagination):
+    """
+    Постраничная выдача по номеру страницы (page, limit).
+    Если передан параметр cursor (в том числе пустой), выдача идёт
+    по курсору: следующая страница выбирается по значениям полей
+    сортировки последней записи, без OFFSET и без подсчёта count.
+    """
     page_query_param = 'page'
     page_size_query_param = 'limit'
     page_size = 5
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.is_cursor_mode(request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        position, reverse = self.decode_cursor(queryset, request)
+        ordering = self.ordering
+        if reverse:
+            ordering = [self._reverse(field) for field in ordering]
+        page = self.get_page(queryset, ordering, position)
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if reverse:
+            page.reverse()
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = has_more if reverse else position is not None
+        self.page = page
+        return page
+
+    def is_cursor_mode(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def get_page(self, queryset, ordering, position):
+        """Не более page_size + 1 записей, следующих за position."""
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position))
+        return list(queryset.order_by(*ordering)[:self.page_size + 1])
+
+    def get_ordering(self, queryset):
+        ordering = [
+            field for field in (
+                queryset.query.order_by or queryset.model._meta.ordering
+            ) if isinstance(field, str)
+        ]
+        if not {'pk', 'id'} & {field.lstrip('-') for field in ordering}:
+            ordering.append('-pk')
+        return ordering
+
+    @staticmethod
+    def _reverse(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _after(ordering, position):
+        """Условие «запись идёт после position» для составного ключа."""
+        condition = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**{
+                ordering[previous].lstrip('-'): position[previous]
+                for previous in range(index)
+            }, **{f'{name}__{lookup}': position[index]})
+        return condition
+
+    def _field(self, queryset, name):
+        if name == 'pk':
+            return queryset.model._meta.pk
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    def decode_cursor(self, queryset, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values = cursor['p']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = [
+                self._field(queryset, field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, KeyError, ValueError, binascii.Error,
+                ValidationError) as error:
+            raise NotFound(self.invalid_cursor_message) from error
+        return position, bool(cursor.get('r'))
+
+    def encode_cursor(self, instance, reverse=False):
+        values = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            values.append(
+                value.isoformat() if hasattr(value, 'isoformat')
+                else str(value)
+            )
+        cursor = {'p': values}
+        if reverse:
+            cursor['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode())
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(url, self.cursor_query_param,
+                                   encoded.decode())
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.encode_cursor(self.page[-1])
+             if self.has_next and self.page else None),
+            ('previous', self.encode_cursor(self.page[0], reverse=True)
+             if self.has_previous and self.page else None),
+            ('results', data),
+        ]))
+
+
+class FeedPagination(CustomPageNumberPagination):
+    """
+    Выдача ленты подписок, всегда по курсору.
+    Если представление задало feed_authors, страница собирается
+    слиянием: у каждого автора по индексу (author, -pub_date, -id)
+    берётся не больше page_size + 1 записей после курсора, все выборки
+    объединяются одним запросом UNION ALL, а затем из найденных записей
+    выбирается страница. СУБД без поддержки LIMIT внутри UNION
+    получают обычный запрос.
+    """
+    def paginate_queryset(self, queryset, request, view=None):
+        self.authors = getattr(view, 'feed_authors', None)
+        return super().paginate_queryset(queryset, request, view)
+
+    def is_cursor_mode(self, request):
+        return True
+
+    def get_page(self, queryset, ordering, position):
+        features = connection.features
+        if not self.authors or not (
+            features.supports_slicing_ordering_in_compound
+        ):
+            return super().get_page(queryset, ordering, position)
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position))
+        queryset = queryset.order_by(*ordering)
+        branches = [
+            queryset.filter(author=author).values_list(
+                'pk', flat=True
+            )[:self.page_size + 1]
+            for author in self.authors
+        ]
+        ids = list(branches[0].union(*branches[1:], all=True))
+        return list(queryset.filter(pk__in=ids)[:self.page_size + 1])
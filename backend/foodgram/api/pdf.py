@@ -0,0 +1,426 @@
+"""
+Минимальная потоковая запись PDF без сторонних зависимостей.
+
+Документ отдаётся частями по мере формирования страниц, поэтому
+память не растёт с количеством строк. Для кириллицы встраивается
+шрифт TrueType (settings.SHOPPING_LIST_PDF_FONT); если файл шрифта
+недоступен, используется Helvetica с транслитерацией. Встраиваются
+только глифы, которые есть в документе: файл шрифта записывается
+после страниц, когда набор символов уже известен. Длинные строки
+переносятся по словам по ширине глифов шрифта.
+"""
+import os
+import struct
+import zlib
+from functools import lru_cache
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN = 50
+FONT_SIZE = 12
+LEADING = 16
+LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LEADING
+TEXT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+# Ширина символа Helvetica (в 1/1000 em) для переноса строк без
+# встроенного шрифта: её метрик нет, поэтому ширина оценивается
+# по ширине цифр.
+HELVETICA_CHAR_WIDTH = 556
+# Таблицы, которые нужны встроенному шрифту CIDFontType2.
+SUBSET_TABLES = (b'cvt ', b'fpgm', b'glyf', b'head', b'hhea', b'hmtx',
+                 b'loca', b'maxp', b'prep')
+# Флаги составного глифа.
+ARG_1_AND_2_ARE_WORDS = 0x1
+WE_HAVE_A_SCALE = 0x8
+MORE_COMPONENTS = 0x20
+WE_HAVE_AN_X_AND_Y_SCALE = 0x40
+WE_HAVE_A_TWO_BY_TWO = 0x80
+
+TRANSLIT = dict(zip(
+    'абвгдеёжзийклмнопрстуфхцчшщъыьэюя',
+    ('a', 'b', 'v', 'g', 'd', 'e', 'e', 'zh', 'z', 'i', 'y', 'k', 'l', 'm',
+     'n', 'o', 'p', 'r', 's', 't', 'u', 'f', 'kh', 'ts', 'ch', 'sh', 'shch',
+     '', 'y', '', 'e', 'yu', 'ya')
+))
+
+
+class TrueTypeFont:
+    """Метрики и таблица символов шрифта TrueType, нужные для PDF."""
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.tables = self._read_tables()
+        if b'glyf' not in self.tables:
+            raise ValueError('Поддерживаются только шрифты TrueType.')
+        head = self.tables[b'head']
+        hhea = self.tables[b'hhea']
+        units = self._unpack('>H', head + 18)[0]
+        self.scale = 1000 / units
+        x_min, y_min, x_max, y_max = self._unpack('>4h', head + 36)
+        self.bbox = [round(v * self.scale)
+                     for v in (x_min, y_min, x_max, y_max)]
+        ascent, descent = self._unpack('>2h', hhea + 4)
+        self.ascent = round(ascent * self.scale)
+        self.descent = round(descent * self.scale)
+        self.widths = self._read_widths(self._unpack('>H', hhea + 34)[0])
+        self.cmap = self._read_cmap()
+        self.loca = self._read_loca()
+
+    def _unpack(self, fmt, offset):
+        return struct.unpack_from(fmt, self.data, offset)
+
+    def _read_tables(self):
+        num_tables = self._unpack('>H', 4)[0]
+        tables = {}
+        self.lengths = {}
+        for i in range(num_tables):
+            tag, _, offset, length = self._unpack('>4sIII', 12 + 16 * i)
+            tables[tag] = offset
+            self.lengths[tag] = length
+        return tables
+
+    def _read_loca(self):
+        """Смещения глифов в таблице glyf, на одно больше числа глифов."""
+        count = self._unpack('>H', self.tables[b'maxp'] + 4)[0] + 1
+        if self._unpack('>h', self.tables[b'head'] + 50)[0]:
+            return list(self._unpack(f'>{count}I', self.tables[b'loca']))
+        return [offset * 2 for offset
+                in self._unpack(f'>{count}H', self.tables[b'loca'])]
+
+    def _read_widths(self, number_of_metrics):
+        hmtx = self.tables[b'hmtx']
+        return [
+            round(self._unpack('>H', hmtx + 4 * i)[0] * self.scale)
+            for i in range(number_of_metrics)
+        ]
+
+    def _read_cmap(self):
+        cmap = self.tables[b'cmap']
+        for i in range(self._unpack('>H', cmap + 2)[0]):
+            platform, encoding, offset = self._unpack('>HHI', cmap + 4 + 8 * i)
+            subtable = cmap + offset
+            if ((platform, encoding) in ((3, 1), (0, 3))
+                    and self._unpack('>H', subtable)[0] == 4):
+                return self._read_cmap_format4(subtable)
+        raise ValueError('В шрифте нет таблицы символов Unicode.')
+
+    def _read_cmap_format4(self, offset):
+        seg_count = self._unpack('>H', offset + 6)[0] // 2
+        ends = offset + 14
+        starts = ends + 2 * seg_count + 2
+        deltas = starts + 2 * seg_count
+        range_offsets = deltas + 2 * seg_count
+        mapping = {}
+        for i in range(seg_count):
+            end = self._unpack('>H', ends + 2 * i)[0]
+            start = self._unpack('>H', starts + 2 * i)[0]
+            delta = self._unpack('>h', deltas + 2 * i)[0]
+            range_offset = self._unpack('>H', range_offsets + 2 * i)[0]
+            for code in range(start, min(end, 0xFFFE) + 1):
+                if range_offset:
+                    address = (range_offsets + 2 * i + range_offset
+                               + 2 * (code - start))
+                    glyph = self._unpack('>H', address)[0]
+                    if not glyph:
+                        continue
+                else:
+                    glyph = code
+                mapping[code] = (glyph + delta) & 0xFFFF
+        return mapping
+
+    def glyph_width(self, glyph):
+        if glyph < len(self.widths):
+            return self.widths[glyph]
+        return self.widths[-1]
+
+    def _glyph(self, glyph):
+        start = self.tables[b'glyf'] + self.loca[glyph]
+        return self.data[start:start + self.loca[glyph + 1]
+                         - self.loca[glyph]]
+
+    def _components(self, glyph):
+        """Глифы, из которых состоит составной глиф."""
+        data = self._glyph(glyph)
+        if len(data) < 10 or struct.unpack_from('>h', data)[0] >= 0:
+            return []
+        components = []
+        offset = 10
+        while True:
+            flags, component = struct.unpack_from('>HH', data, offset)
+            components.append(component)
+            offset += 8 if flags & ARG_1_AND_2_ARE_WORDS else 6
+            if flags & WE_HAVE_A_SCALE:
+                offset += 2
+            elif flags & WE_HAVE_AN_X_AND_Y_SCALE:
+                offset += 4
+            elif flags & WE_HAVE_A_TWO_BY_TWO:
+                offset += 8
+            if not flags & MORE_COMPONENTS:
+                return components
+
+    def subset(self, glyphs):
+        """
+        Файл шрифта только с глифами glyphs (и их составными частями).
+        Номера глифов не меняются, остальные глифы пустые.
+        """
+        count = len(self.loca) - 1
+        needed = set()
+        queue = [0, *glyphs]
+        while queue:
+            glyph = queue.pop()
+            if glyph not in needed and glyph < count:
+                needed.add(glyph)
+                queue += self._components(glyph)
+        glyf = bytearray()
+        loca = []
+        for glyph in range(count):
+            loca.append(len(glyf))
+            if glyph in needed:
+                glyf += self._glyph(glyph)
+                glyf += bytes(-len(glyf) % 4)
+        loca.append(len(glyf))
+        tables = {
+            tag: self.data[offset:offset + self.lengths[tag]]
+            for tag, offset in self.tables.items() if tag in SUBSET_TABLES
+        }
+        head = bytearray(tables[b'head'])
+        struct.pack_into('>I', head, 8, 0)
+        struct.pack_into('>h', head, 50, 1)
+        tables.update({b'head': bytes(head), b'glyf': bytes(glyf),
+                       b'loca': struct.pack(f'>{len(loca)}I', *loca)})
+        return self._build(tables)
+
+    def _build(self, tables):
+        tags = sorted(tables)
+        selector = len(tags).bit_length() - 1
+        search_range = 16 << selector
+        header = self.data[:4] + struct.pack(
+            '>4H', len(tags), search_range, selector,
+            16 * len(tags) - search_range
+        )
+        offset = len(header) + 16 * len(tags)
+        directory, body, offsets = [], [], {}
+        for tag in tags:
+            data = tables[tag]
+            directory.append(struct.pack('>4sIII', tag, _checksum(data),
+                                         offset, len(data)))
+            offsets[tag] = offset
+            body.append(data + bytes(-len(data) % 4))
+            offset += len(body[-1])
+        font = bytearray(header + b''.join(directory) + b''.join(body))
+        struct.pack_into('>I', font, offsets[b'head'] + 8,
+                         (0xB1B0AFBA - _checksum(font)) & 0xFFFFFFFF)
+        return bytes(font)
+
+
+def _checksum(data):
+    data = bytes(data) + bytes(-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}I', data)) & 0xFFFFFFFF
+
+
+@lru_cache(maxsize=None)
+def load_font(path):
+    """Загружает шрифт один раз на процесс; None, если он недоступен."""
+    if not path:
+        return None
+    try:
+        return TrueTypeFont(path)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def _escape(text):
+    return (text.replace('\\', '\\\\').replace('(', '\\(')
+            .replace(')', '\\)'))
+
+
+def _transliterate(text):
+    return ''.join(
+        TRANSLIT.get(char, char) if char.islower()
+        else TRANSLIT.get(char.lower(), char).capitalize()
+        for char in text
+    )
+
+
+def _wrap(text, char_width):
+    """
+    Разбивает строку на части не шире TEXT_WIDTH по словам; слово
+    длиннее строки разбивается по символам.
+    """
+    space = char_width(' ')
+    parts, line, line_width = [], '', 0
+    for word in text.split(' '):
+        word_width = sum(map(char_width, word))
+        if line and line_width + space + word_width <= TEXT_WIDTH:
+            line += ' ' + word
+            line_width += space + word_width
+            continue
+        if line:
+            parts.append(line)
+            line, line_width = '', 0
+        for char in word:
+            width = char_width(char)
+            if line and line_width + width > TEXT_WIDTH:
+                parts.append(line)
+                line, line_width = '', 0
+            line += char
+            line_width += width
+    parts.append(line)
+    return parts
+
+
+def _paginate(lines, char_width):
+    """Перенесённые строки по страницам; хотя бы одна страница."""
+    page_lines, full_pages = [], 0
+    for line in lines:
+        for part in _wrap(line, char_width):
+            page_lines.append(part)
+            if len(page_lines) == LINES_PER_PAGE:
+                yield page_lines
+                page_lines, full_pages = [], full_pages + 1
+    if page_lines or not full_pages:
+        yield page_lines
+
+
+class PDFStream:
+    """Последовательная запись объектов PDF с учётом их смещений."""
+    def __init__(self):
+        self.offsets = {}
+        self.position = 0
+        self.last_number = 0
+
+    def reserve(self):
+        self.last_number += 1
+        return self.last_number
+
+    def raw(self, data):
+        self.position += len(data)
+        return data
+
+    def obj(self, number, body):
+        self.offsets[number] = self.position
+        return self.raw(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def stream(self, number, data, extra=b''):
+        return self.obj(number, b'<< /Length %d %s>>\nstream\n%s\nendstream'
+                        % (len(data), extra, data))
+
+    def trailer(self, root):
+        xref = self.position
+        rows = [b'xref\n0 %d\n0000000000 65535 f \n' % (self.last_number + 1)]
+        rows += [b'%010d 00000 n \n' % self.offsets[number]
+                 for number in range(1, self.last_number + 1)]
+        rows.append(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n'
+                    b'%%%%EOF\n' % (self.last_number + 1, root, xref))
+        return self.raw(b''.join(rows))
+
+
+def iter_pdf(lines, font_path=None):
+    """Формирует PDF из строк текста, отдавая его частями."""
+    font = load_font(font_path)
+    pdf = PDFStream()
+    catalog, pages, font_ref = pdf.reserve(), pdf.reserve(), pdf.reserve()
+    yield pdf.raw(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    yield pdf.obj(catalog, b'<< /Type /Catalog /Pages %d 0 R >>' % pages)
+    used_glyphs = {}
+    if font is not None:
+        cid_font, descriptor, font_file, to_unicode = (
+            pdf.reserve(), pdf.reserve(), pdf.reserve(), pdf.reserve()
+        )
+        base_font = font.name.replace(' ', '').encode('ascii', 'ignore')
+        yield pdf.obj(font_ref, (
+            b'<< /Type /Font /Subtype /Type0 /BaseFont /%s '
+            b'/Encoding /Identity-H /DescendantFonts [%d 0 R] '
+            b'/ToUnicode %d 0 R >>' % (base_font, cid_font, to_unicode)
+        ))
+    else:
+        yield pdf.obj(font_ref, (
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+            b'/Encoding /WinAnsiEncoding >>'
+        ))
+
+    def char_width(char):
+        if font is None:
+            width = len(_transliterate(char)) * HELVETICA_CHAR_WIDTH
+        else:
+            width = font.glyph_width(font.cmap.get(ord(char), 0))
+        return width * FONT_SIZE / 1000
+
+    def encode(text):
+        if font is None:
+            return b'(%s)' % _escape(_transliterate(text)).encode(
+                'cp1252', 'replace'
+            )
+        glyphs = []
+        for char in text:
+            glyph = font.cmap.get(ord(char), 0)
+            used_glyphs[glyph] = char
+            glyphs.append(b'%04X' % glyph)
+        return b'<%s>' % b''.join(glyphs)
+
+    def page(page_lines):
+        number, content = pdf.reserve(), pdf.reserve()
+        commands = [b'BT /F1 %d Tf %d TL %d %d Td' % (
+            FONT_SIZE, LEADING, MARGIN, PAGE_HEIGHT - MARGIN - FONT_SIZE
+        )]
+        commands += [b'%s Tj T*' % encode(line) for line in page_lines]
+        commands.append(b'ET')
+        kids.append(number)
+        return pdf.stream(content, b'\n'.join(commands)) + pdf.obj(number, (
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] '
+            b'/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>'
+            % (pages, PAGE_WIDTH, PAGE_HEIGHT, font_ref, content)
+        ))
+
+    kids = []
+    for page_lines in _paginate(lines, char_width):
+        yield page(page_lines)
+    yield pdf.obj(pages, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+        b' '.join(b'%d 0 R' % kid for kid in kids), len(kids)
+    ))
+    if font is not None:
+        glyphs = sorted(used_glyphs)
+        yield pdf.obj(cid_font, (
+            b'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /%s '
+            b'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) '
+            b'/Supplement 0 >> /FontDescriptor %d 0 R /DW 1000 '
+            b'/W [%s] /CIDToGIDMap /Identity >>' % (
+                base_font, descriptor, b' '.join(
+                    b'%d [%d]' % (glyph, font.glyph_width(glyph))
+                    for glyph in glyphs
+                )
+            )
+        ))
+        yield pdf.stream(to_unicode, _to_unicode_cmap(used_glyphs))
+        yield pdf.obj(descriptor, (
+            b'<< /Type /FontDescriptor /FontName /%s /Flags 32 '
+            b'/FontBBox [%s] /ItalicAngle 0 /Ascent %d /Descent %d '
+            b'/CapHeight %d /StemV 80 /FontFile2 %d 0 R >>' % (
+                base_font, ' '.join(map(str, font.bbox)).encode(),
+                font.ascent, font.descent, font.ascent, font_file
+            )
+        ))
+        font_data = font.subset(glyphs)
+        yield pdf.stream(font_file, zlib.compress(font_data),
+                         b'/Length1 %d /Filter /FlateDecode ' % len(font_data))
+    yield pdf.trailer(catalog)
+
+
+def _to_unicode_cmap(used_glyphs):
+    rows = [
+        b'/CIDInit /ProcSet findresource begin 12 dict begin begincmap',
+        b'/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) '
+        b'/Supplement 0 >> def',
+        b'/CMapName /Adobe-Identity-UCS def /CMapType 2 def',
+        b'1 begincodespacerange <0000> <FFFF> endcodespacerange',
+    ]
+    glyphs = sorted(used_glyphs)
+    for start in range(0, len(glyphs), 100):
+        block = glyphs[start:start + 100]
+        rows.append(b'%d beginbfchar' % len(block))
+        rows += [b'<%04X> <%04X>' % (glyph, ord(used_glyphs[glyph]))
+                 for glyph in block]
+        rows.append(b'endbfchar')
+    rows.append(b'endcmap CMapName currentdict /CMap defineresource pop '
+                b'end end')
+    return b'\n'.join(rows)
@@ -1,9 +1,11 @@
-import base64
-
 from django.core.exceptions import ValidationError
-from django.core.files.base import ContentFile
+from django.db import transaction
+from recipes.images import (ImageError, decode_base64_image, rendition_urls,
+                            schedule_renditions)
 from recipes.models import (FavoriteRecipes, Ingredients,
-                            IngredientsForRecipes, Recipes, ShoppingCart, Tags)
+                            IngredientsForRecipes, Recipes, ShoppingCart,
+                            ShoppingCartTotals, Tags)
+from recipes.search import update_search_vector
 from rest_framework import serializers
 from users.serializers import CustomUserSerializer
 
@@ -12,9 +14,10 @@ class Base64ImageField(serializers.ImageField):
     """Сериализатор изображений."""
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            try:
+                data = decode_base64_image(data)
+            except ImageError as error:
+                raise serializers.ValidationError(str(error)) from error
 
         return super().to_internal_value(data)
 
@@ -60,12 +63,18 @@ class RecipesSerializer(serializers.ModelSerializer):
     ingredients = IngredientsForRecipesSerializer(read_only=True, many=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipes
-        exclude = ('pub_date', )
+        exclude = ('pub_date', 'updated_at', 'search_vector', 'images_ready')
+
+    def get_images(self, obj):
+        return rendition_urls(obj, self.context.get('request'))
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -74,6 +83,8 @@ class RecipesSerializer(serializers.ModelSerializer):
         ).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -95,66 +106,145 @@ class RecipesSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Данный рецепт уже есть в Ваших рецептах.'
             )
-        ingredients = self.initial_data.get('ingredients')
-        ingredients_list = {}
+        data['ingredients'] = self.validate_ingredients_list(
+            self.initial_data.get('ingredients')
+        )
+        tags = self.initial_data.get('tags')
+        if tags is not None or not self.partial:
+            data['tags'] = self.validate_tags_list(tags)
+        return data
+
+    def validate_ingredients_list(self, ingredients):
+        """
+        Возвращает словарь {id ингредиента: количество}.
+        Все ингредиенты проверяются одним запросом.
+        """
         if not ingredients:
             raise ValidationError('Необходимо добавить ингредиент в рецепт')
-        for ingredient in ingredients:
-            if ingredient.get('id') in ingredients_list:
-                raise ValidationError(
-                    'Ингредиент можно добавить только один раз'
-                )
-            if int(ingredient.get('amount')) <= 0:
-                raise ValidationError(
-                    'Необходимо добавить количество ингредиента больше 0'
-                )
-            ingredients_list[ingredient.get('id')] = (
-                ingredients_list.get('amount')
+        amounts = {}
+        try:
+            for ingredient in ingredients:
+                ingredient_id = int(ingredient.get('id'))
+                amount = int(ingredient.get('amount'))
+                if ingredient_id in amounts:
+                    raise ValidationError(
+                        'Ингредиент можно добавить только один раз'
+                    )
+                if amount <= 0:
+                    raise ValidationError(
+                        'Необходимо добавить количество ингредиента больше 0'
+                    )
+                amounts[ingredient_id] = amount
+        except (AttributeError, TypeError, ValueError) as error:
+            raise ValidationError('Неверный формат ингредиентов') from error
+        missing = amounts.keys() - Ingredients.objects.in_bulk(amounts).keys()
+        if missing:
+            raise ValidationError(
+                f'Ингредиенты не найдены: {sorted(missing)}'
             )
-        return data
+        return amounts
 
-    def adding_ingredients(self, recipes, ingredients):
-        ingredients_list = []
-        for ingredient in ingredients:
-            current_ingredient = Ingredients.objects.get(
-                id=ingredient.get('id')
-            )
-            current_amount = ingredient.get('amount')
-            ingredients_list.append(
-                IngredientsForRecipes(
-                    recipes=recipes,
-                    ingredients=current_ingredient,
-                    amount=current_amount
-                )
-            )
-        IngredientsForRecipes.objects.bulk_create(ingredients_list)
+    def validate_tags_list(self, tags):
+        """Возвращает множество id тегов, проверенных одним запросом."""
+        try:
+            tags = {int(tag) for tag in tags or ()}
+        except (TypeError, ValueError) as error:
+            raise ValidationError('Неверный формат тегов') from error
+        missing = tags - Tags.objects.in_bulk(tags).keys()
+        if missing:
+            raise ValidationError(f'Теги не найдены: {sorted(missing)}')
+        return tags
+
+    def adding_ingredients(self, recipes, amounts):
+        IngredientsForRecipes.objects.bulk_create(
+            IngredientsForRecipes(
+                recipes=recipes, ingredients_id=ingredient, amount=amount
+            ) for ingredient, amount in amounts.items()
+        )
 
     def create(self, validated_data):
-        ingredients_list = self.initial_data.get('ingredients')
-        image = validated_data.pop('image')
-        recipes = Recipes.objects.create(image=image,
-                                         author=self.context['request'].user,
-                                         **validated_data)
-        tags = self.initial_data.get('tags')
-        recipes.tags.set(tags)
-        self.adding_ingredients(recipes, ingredients_list)
+        amounts = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags')
+        with transaction.atomic():
+            recipes = Recipes.objects.create(
+                author=self.context['request'].user, **validated_data
+            )
+            recipes.tags.add(*tags)
+            self.adding_ingredients(recipes, amounts)
+            update_search_vector(recipes.pk)
+            schedule_renditions(recipes)
         return recipes
 
     def update(self, instance, validated_data):
-        instance.name = validated_data.get('name', instance.name)
-        instance.image = validated_data.get('image', instance.image)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get('cooking_time',
-                                                   instance.cooking_time)
-        instance.tags.clear()
-        tags = self.initial_data.get('tags')
-        instance.tags.set(tags)
-        instance.save()
-        IngredientsForRecipes.objects.filter(recipes=instance).delete()
-        ingredients_list = self.initial_data.get('ingredients')
-        self.adding_ingredients(instance, ingredients_list)
+        """
+        Изменяет только отличающиеся строки: лишние ингредиенты удаляются,
+        новые добавляются, у оставшихся обновляется количество.
+        """
+        amounts = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags', None)
+        search_changed = any(
+            getattr(instance, field) != validated_data[field]
+            for field in ('name', 'text') if field in validated_data
+        )
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        if 'image' in validated_data:
+            instance.images_ready = False
+        with transaction.atomic():
+            instance.save()
+            if 'image' in validated_data:
+                schedule_renditions(instance)
+            if tags is not None:
+                instance.tags.set(tags)
+            deltas, composition_changed = self.updating_ingredients(
+                instance, amounts
+            )
+            ShoppingCartTotals.objects.change_recipe(instance, deltas)
+            if search_changed or composition_changed:
+                update_search_vector(instance.pk)
         return instance
 
+    def updating_ingredients(self, recipes, amounts):
+        """
+        Приводит ингредиенты рецепта к amounts. Возвращает изменения
+        количеств {id ингредиента: разница} и признак того, что изменился
+        сам набор ингредиентов.
+        """
+        existing = {
+            row.ingredients_id: row
+            for row in IngredientsForRecipes.objects.filter(
+                recipes=recipes
+            ).only('id', 'ingredients_id', 'amount')
+        }
+        deltas = {}
+        removed = [
+            row for ingredient, row in existing.items()
+            if ingredient not in amounts
+        ]
+        changed = []
+        for ingredient, amount in amounts.items():
+            row = existing.get(ingredient)
+            if row is None or row.amount != amount:
+                deltas[ingredient] = amount - (row.amount if row else 0)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        for row in removed:
+            deltas[row.ingredients_id] = -row.amount
+        if removed:
+            IngredientsForRecipes.objects.filter(
+                pk__in=[row.pk for row in removed]
+            ).delete()
+        if changed:
+            IngredientsForRecipes.objects.bulk_update(changed, ['amount'])
+        added = {
+            ingredient: amount for ingredient, amount in amounts.items()
+            if ingredient not in existing
+        }
+        if added:
+            self.adding_ingredients(recipes, added)
+        return deltas, bool(removed or added)
+
 
 class FavoriteRecipesSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения избранных рецептов."""
@@ -168,6 +258,24 @@ class FavoriteRecipesSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class RecipesIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетного добавления и удаления."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+
+    def validate_recipes(self, value):
+        recipes = Recipes.objects.in_bulk(value)
+        missing = set(value) - recipes.keys()
+        if missing:
+            raise serializers.ValidationError(
+                f'Рецепты не найдены: {sorted(missing)}'
+            )
+        return recipes
+
+
 class ShoppingCartSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения списка покупок."""
     id = serializers.ReadOnlyField(source='recipes.id')
@@ -0,0 +1,98 @@
+"""Потоковая выгрузка списка покупок в разных форматах."""
+import csv
+import json
+
+from django.conf import settings
+from recipes.models import ShoppingCartTotals
+
+from .pdf import iter_pdf
+
+TITLE = 'Список покупок:'
+CHUNK_SIZE = 8192
+
+
+def get_shopping_list(user):
+    """Суммарное количество ингредиентов из списка покупок пользователя."""
+    return ShoppingCartTotals.objects.filter(user=user).values(
+        'ingredients__name', 'ingredients__measurement_unit', 'amount'
+    ).order_by('ingredients__name').iterator()
+
+
+def _lines(ingredients):
+    for ingredient in ingredients:
+        yield (f"{ingredient['ingredients__name']} - {ingredient['amount']} "
+               f"{ingredient['ingredients__measurement_unit']}")
+
+
+def iter_txt(ingredients):
+    yield f'{TITLE}\n\n'
+    for line in _lines(ingredients):
+        yield f'{line}\n'
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: возвращает строку вместо записи."""
+    def write(self, value):
+        return value
+
+
+def iter_csv(ingredients):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredients__name'],
+            ingredient['amount'],
+            ingredient['ingredients__measurement_unit'],
+        ))
+
+
+def iter_json(ingredients):
+    separator = '['
+    for ingredient in ingredients:
+        yield separator + json.dumps({
+            'name': ingredient['ingredients__name'],
+            'amount': ingredient['amount'],
+            'measurement_unit': ingredient['ingredients__measurement_unit'],
+        }, ensure_ascii=False)
+        separator = ',\n'
+    yield '[]\n' if separator == '[' else ']\n'
+
+
+def iter_pdf_list(ingredients):
+    return iter_pdf(_with_title(_lines(ingredients)),
+                    settings.SHOPPING_LIST_PDF_FONT)
+
+
+def _with_title(lines):
+    yield TITLE
+    yield ''
+    yield from lines
+
+
+EXPORTERS = {
+    'txt': iter_txt,
+    'csv': iter_csv,
+    'json': iter_json,
+    'pdf': iter_pdf_list,
+}
+
+
+def buffered(chunks, size=CHUNK_SIZE):
+    """Объединяет мелкие части ответа в блоки около size байт."""
+    buffer, length = [], 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def export_shopping_list(user, export_format):
+    """Возвращает генератор содержимого файла в выбранном формате."""
+    return buffered(EXPORTERS[export_format](get_shopping_list(user)))
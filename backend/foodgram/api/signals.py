@@ -0,0 +1,127 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+from recipes.feed import follow_added, follow_removed, recipe_published
+from recipes.models import (FavoriteRecipes, Ingredients,
+                            IngredientsForRecipes, Recipes, ShoppingCart,
+                            ShoppingCartTotals, Tags)
+from recipes.search import update_search_vector
+from recipes.signals import ingredients_imported
+from users.models import Follow, User
+
+from .autocomplete import ingredients_index
+from .cache import invalidate
+
+CACHE_GROUPS = {
+    Recipes: ('recipes',),
+    IngredientsForRecipes: ('recipes',),
+    Tags: ('tags', 'recipes'),
+    Ingredients: ('ingredients', 'recipes'),
+    User: ('recipes',),
+}
+
+USER_VERSIONS = {
+    FavoriteRecipes: 'favorites_version',
+    ShoppingCart: 'shopping_cart_version',
+    Follow: 'follows_version',
+}
+
+
+def bump_version(model, user_id):
+    """
+    Увеличивает версию избранного, списка покупок или подписок
+    пользователя. Нужна и там, где сигналы не отправляются (bulk_create).
+    """
+    field = USER_VERSIONS[model]
+    User.objects.filter(pk=user_id).update(**{field: F(field) + 1})
+
+
+def _is_last_login_update(update_fields):
+    return update_fields == frozenset({'last_login'})
+
+
+@receiver([post_save, post_delete], sender=Ingredients)
+def invalidate_ingredients_index(**kwargs):
+    ingredients_index.invalidate()
+
+
+@receiver(ingredients_imported)
+def invalidate_imported_ingredients(**kwargs):
+    ingredients_index.invalidate()
+    transaction.on_commit(lambda: invalidate(*CACHE_GROUPS[Ingredients]))
+
+
+@receiver([post_save, post_delete])
+def invalidate_api_cache(sender, update_fields=None, **kwargs):
+    groups = CACHE_GROUPS.get(sender)
+    if groups is None or _is_last_login_update(update_fields):
+        return
+    transaction.on_commit(lambda: invalidate(*groups))
+
+
+@receiver(m2m_changed, sender=Recipes.tags.through)
+def invalidate_recipes_tags_cache(action, **kwargs):
+    if action.startswith('post_'):
+        transaction.on_commit(lambda: invalidate('recipes'))
+
+
+@receiver([post_save, post_delete])
+def bump_user_version(sender, instance, **kwargs):
+    if sender in USER_VERSIONS:
+        bump_version(sender, instance.user_id)
+
+
+@receiver([post_save, pre_delete], sender=Tags)
+def touch_tag_recipes(instance, **kwargs):
+    Recipes.objects.filter(tags=instance).update(updated_at=timezone.now())
+
+
+@receiver([post_save, pre_delete], sender=Ingredients)
+def touch_ingredient_recipes(instance, **kwargs):
+    recipes = Recipes.objects.filter(ingredients__ingredients=instance)
+    recipes_ids = list(recipes.values_list('pk', flat=True))
+    if not recipes_ids:
+        return
+    recipes.update(updated_at=timezone.now())
+    # Название ингредиента входит в поисковый вектор рецептов; при
+    # удалении вектор пересчитывается после удаления связей рецептов.
+    transaction.on_commit(lambda: update_search_vector(*recipes_ids))
+
+
+@receiver(pre_delete, sender=Recipes)
+def discard_shopping_cart_totals(instance, **kwargs):
+    # Удаление любым путём (API, админка, удаление автора) убирает
+    # рецепт из сводных списков. Блокировка строки рецепта не даёт
+    # добавить его в список покупок, пока он не удалён.
+    Recipes.objects.select_for_update().filter(pk=instance.pk).first()
+    ShoppingCartTotals.objects.discard_recipe(instance)
+
+
+@receiver(post_save, sender=User)
+def touch_author_stamps(instance, update_fields=None, **kwargs):
+    if _is_last_login_update(update_fields):
+        return
+    Recipes.objects.filter(author=instance).update(updated_at=timezone.now())
+    User.objects.filter(follower__author=instance).update(
+        follows_version=F('follows_version') + 1
+    )
+
+
+@receiver(post_save, sender=Recipes)
+def add_to_feeds(instance, created, **kwargs):
+    if created:
+        recipe_published(instance)
+
+
+@receiver(post_save, sender=Follow)
+def add_author_to_feed(instance, created, **kwargs):
+    if created:
+        follow_added(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def remove_author_from_feed(instance, **kwargs):
+    follow_removed(instance.user_id, instance.author_id)
@@ -0,0 +1,698 @@
+import csv
+import io
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from recipes.models import (FavoriteRecipes, FeedEntry, Ingredients,
+                            IngredientsForRecipes, Recipes, RecipeScore,
+                            ShoppingCart, ShoppingCartTotals, Tags)
+from recipes.trending import update_scores
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import Follow, User
+
+from .autocomplete import ingredients_index
+from .pdf import LINES_PER_PAGE, _wrap, iter_pdf
+
+
+def authorized_client(user):
+    client = APIClient()
+    token, _ = Token.objects.get_or_create(user=user)
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+class RecipesAPITestCase(TestCase):
+    """Пользователи, ингредиенты и рецепты для проверок API."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create(username=f'cook{i}',
+                                email=f'cook{i}@example.com',
+                                first_name='Имя', last_name='Фамилия')
+            for i in range(3)
+        ]
+        cls.tag = Tags.objects.create(name='Обед', color='#E26C2D',
+                                      slug='lunch')
+        cls.ingredients = [
+            Ingredients.objects.create(name=name, measurement_unit='г')
+            for name in ('сахар', 'мука', 'соль', 'масло')
+        ]
+        cls.recipes = [
+            cls.create_recipes(cls.users[i % 3], f'Рецепт {i}', {
+                cls.ingredients[i % 4]: 10 * (i + 1),
+                cls.ingredients[(i + 1) % 4]: 5,
+            })
+            for i in range(6)
+        ]
+
+    @classmethod
+    def create_recipes(cls, author, name, amounts):
+        recipes = Recipes.objects.create(
+            author=author, name=name, image='recipes/temp.png',
+            text='Описание', cooking_time=10
+        )
+        recipes.tags.add(cls.tag)
+        IngredientsForRecipes.objects.bulk_create(
+            IngredientsForRecipes(recipes=recipes, ingredients=ingredient,
+                                  amount=amount)
+            for ingredient, amount in amounts.items()
+        )
+        return recipes
+
+    def setUp(self):
+        cache.clear()
+        ingredients_index.invalidate()
+        self.clients = [authorized_client(user) for user in self.users]
+
+
+class CursorPaginationTest(RecipesAPITestCase):
+    """Выдача списка рецептов по курсору."""
+    def pages(self, url, key):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 4)
+            ids.append([recipes['id'] for recipes in
+                        response.data['results']])
+            url = response.data[key]
+        return ids
+
+    def test_next_and_previous(self):
+        ordered = [recipes['id'] for recipes in self.client.get(
+            '/api/recipes/?limit=100'
+        ).data['results']]
+        pages = self.pages('/api/recipes/?cursor=&limit=4', 'next')
+        self.assertEqual(sum(pages, []), ordered)
+        self.assertEqual([len(page) for page in pages], [4, 2])
+        last = self.client.get('/api/recipes/?cursor=&limit=4').data['next']
+        previous = self.client.get(last).data['previous']
+        self.assertEqual(self.pages(previous, 'previous'), [pages[0]])
+
+    def test_first_page_has_no_previous(self):
+        response = self.client.get('/api/recipes/?cursor=&limit=4')
+        self.assertIsNone(response.data['previous'])
+        self.assertNotIn('count', response.data)
+
+    def test_invalid_cursor(self):
+        for cursor in ('abc', 'eyJwIjogWzFdfQ==', 'eyJ4IjogMX0='):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f'/api/recipes/?cursor={cursor}')
+                self.assertEqual(response.status_code, 404)
+
+
+class RecipesListQueriesTest(TestCase):
+    """Число запросов к базе в списке рецептов не зависит от размера."""
+    @classmethod
+    def setUpTestData(cls):
+        authors = [
+            User.objects.create(username=f'author{i}',
+                                email=f'author{i}@example.com',
+                                first_name='Имя', last_name='Фамилия')
+            for i in range(5)
+        ]
+        cls.user = authors[0]
+        Follow.objects.create(user=cls.user, author=authors[1])
+        tags = [Tags.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                                    slug=f'tag{i}') for i in range(3)]
+        ingredients = [
+            Ingredients.objects.create(name=f'Ингредиент {i}',
+                                       measurement_unit='г')
+            for i in range(10)
+        ]
+        for i in range(25):
+            recipes = Recipes.objects.create(
+                author=authors[i % len(authors)], name=f'Рецепт {i}',
+                image='recipes/temp.png', text='Описание', cooking_time=10
+            )
+            recipes.tags.set(tags[:i % 3 + 1])
+            IngredientsForRecipes.objects.bulk_create(
+                IngredientsForRecipes(recipes=recipes,
+                                      ingredients=ingredients[(i + j) % 10],
+                                      amount=j + 1)
+                for j in range(4)
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = APIClient()
+        self.authorized = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.authorized.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def assert_list_queries(self, client, number):
+        for limit in (5, 20):
+            with self.subTest(limit=limit), self.assertNumQueries(number):
+                response = client.get(f'/api/recipes/?limit={limit}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        # ETag, страница, число рецептов, теги, ингредиенты.
+        self.assert_list_queries(self.anonymous, 5)
+
+    def test_authorized(self):
+        # Сверх анонимного: токен и подписки пользователя для флага
+        # is_subscribed авторов.
+        self.assert_list_queries(self.authorized, 7)
+
+
+@mock.patch('recipes.trending.LAG', timedelta(0))
+class TrendingScoresTest(TestCase):
+    """Инкрементальный пересчёт рейтинга совпадает с полным."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create(username=f'user{i}',
+                                email=f'user{i}@example.com',
+                                first_name='Имя', last_name='Фамилия')
+            for i in range(3)
+        ]
+        cls.recipes = [
+            Recipes.objects.create(
+                author=cls.users[0], name=f'Рецепт {i}',
+                image='recipes/temp.png', text='Описание', cooking_time=10
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.clients = []
+        for user in self.users:
+            client = APIClient()
+            token = Token.objects.create(user=user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+            self.clients.append(client)
+
+    def toggle(self, client, recipes, action, method):
+        response = getattr(client, method)(
+            f'/api/recipes/{recipes.pk}/{action}/'
+        )
+        self.assertIn(response.status_code, (201, 204))
+
+    @staticmethod
+    def scores():
+        return dict(RecipeScore.objects.values_list('recipes', 'score'))
+
+    def assert_matches_full(self):
+        incremental = self.scores()
+        update_scores(full=True)
+        full = self.scores()
+        self.assertEqual(incremental.keys(), full.keys())
+        for recipes_id, score in full.items():
+            self.assertAlmostEqual(incremental[recipes_id], score)
+
+    def test_toggle(self):
+        for client in self.clients:
+            self.toggle(client, self.recipes[0], 'favorite', 'post')
+            self.toggle(client, self.recipes[1], 'shopping_cart', 'post')
+        self.toggle(self.clients[0], self.recipes[2], 'favorite', 'post')
+        update_scores()
+        for _ in range(3):
+            self.toggle(self.clients[0], self.recipes[0], 'favorite',
+                        'delete')
+            self.toggle(self.clients[0], self.recipes[0], 'favorite', 'post')
+        self.toggle(self.clients[1], self.recipes[1], 'shopping_cart',
+                    'delete')
+        self.toggle(self.clients[0], self.recipes[2], 'favorite', 'delete')
+        update_scores()
+        self.assertNotIn(self.recipes[2].pk, self.scores())
+        self.assert_matches_full()
+
+
+class BulkChangeTest(RecipesAPITestCase):
+    """Пакетное добавление в избранное и список покупок и удаление."""
+    def change(self, action, method, recipes, status_code):
+        response = getattr(self.clients[0], method)(
+            f'/api/recipes/{action}/', {'recipes': recipes}, format='json'
+        )
+        self.assertEqual(response.status_code, status_code)
+        return response
+
+    def assert_counters(self, field, expected):
+        self.assertEqual(dict(Recipes.objects.values_list('pk', field)),
+                         {recipes.pk: expected.get(recipes.pk, 0)
+                          for recipes in self.recipes})
+
+    def test_add_and_remove(self):
+        first, second, third = (recipes.pk for recipes in self.recipes[:3])
+        for action, field in (('favorite', 'favorites_count'),
+                              ('shopping_cart', 'in_carts_count')):
+            with self.subTest(action=action):
+                response = self.change(action, 'post', [first, second], 201)
+                self.assertEqual(
+                    sorted(item['id'] for item in response.data),
+                    [first, second]
+                )
+                # Уже добавленные и повторённые рецепты пропускаются.
+                response = self.change(action, 'post',
+                                       [first, third, third], 201)
+                self.assertEqual([item['id'] for item in response.data],
+                                 [third])
+                self.assert_counters(field, {first: 1, second: 1, third: 1})
+                self.change(action, 'delete', [first, second, second], 204)
+                self.change(action, 'delete', [first], 204)
+                self.assert_counters(field, {third: 1})
+
+    def test_nonexistent_recipes(self):
+        existing = self.recipes[0].pk
+        missing = Recipes.objects.order_by('-pk').first().pk + 1
+        for method in ('post', 'delete'):
+            with self.subTest(method=method):
+                response = self.change('favorite', method,
+                                       [existing, missing], 400)
+                self.assertIn(str(missing), str(response.data['recipes']))
+                self.assert_counters('favorites_count', {})
+        self.assertFalse(FavoriteRecipes.objects.exists())
+
+    def test_invalid_payload(self):
+        for recipes in ([], 'abc', [0]):
+            with self.subTest(recipes=recipes):
+                self.change('shopping_cart', 'post', recipes, 400)
+        self.assertFalse(ShoppingCart.objects.exists())
+
+
+class DownloadShoppingCartTest(RecipesAPITestCase):
+    """Выгрузка списка покупок в разных форматах."""
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        # Сахар: 10 + 50 г, мука: 5 + 5 г.
+        for recipes in (self.recipes[0], self.recipes[4]):
+            self.clients[0].post(f'/api/recipes/{recipes.pk}/shopping_cart/')
+
+    def download(self, file_format):
+        response = self.clients[0].get(self.url, {'format': file_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'],
+                         f'attachment; filename="ShoppingList.{file_format}"')
+        return response, b''.join(response.streaming_content)
+
+    def test_txt(self):
+        response, content = self.download('txt')
+        self.assertEqual(response['Content-Type'],
+                         'text/plain;charset=UTF-8')
+        self.assertEqual(content.decode().splitlines(), [
+            'Список покупок:', '', 'мука - 10 г', 'сахар - 60 г'
+        ])
+
+    def test_csv(self):
+        response, content = self.download('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv;charset=UTF-8')
+        self.assertEqual(list(csv.reader(io.StringIO(content.decode()))), [
+            ['name', 'amount', 'measurement_unit'],
+            ['мука', '10', 'г'],
+            ['сахар', '60', 'г'],
+        ])
+
+    def test_json(self):
+        response, content = self.download('json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(content), [
+            {'name': 'мука', 'amount': 10, 'measurement_unit': 'г'},
+            {'name': 'сахар', 'amount': 60, 'measurement_unit': 'г'},
+        ])
+
+    def test_pdf(self):
+        response, content = self.download('pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF-'))
+        self.assertTrue(content.rstrip().endswith(b'%%EOF'))
+
+    def test_empty(self):
+        response = self.clients[1].get(self.url, {'format': 'json'})
+        self.assertEqual(json.loads(b''.join(response.streaming_content)),
+                         [])
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.assertEqual(
+            self.clients[0].get(self.url, {'format': 'xml'}).status_code, 404
+        )
+
+
+def run_on_commit(func, using=None):
+    func()
+
+
+# TestCase не фиксирует транзакцию: кэш сбрасывается сразу.
+@mock.patch('django.db.transaction.on_commit', run_on_commit)
+class ConditionalGetTest(RecipesAPITestCase):
+    """ETag рецептов: 304 без изменений и новый ETag после записи."""
+    def assert_not_modified(self, client, url):
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        return etag
+
+    def assert_changed(self, client, url, etag):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_recipes_update(self):
+        recipes = self.recipes[0]
+        urls = ('/api/recipes/', f'/api/recipes/{recipes.pk}/')
+        etags = [self.assert_not_modified(self.client, url) for url in urls]
+        response = self.clients[0].patch(
+            f'/api/recipes/{recipes.pk}/',
+            {'name': 'Новое название', 'ingredients': [
+                {'id': self.ingredients[0].pk, 'amount': 1}
+            ]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        for url, etag in zip(urls, etags):
+            with self.subTest(url=url):
+                self.assert_changed(self.client, url, etag)
+
+    def test_recipes_delete(self):
+        etag = self.assert_not_modified(self.client, '/api/recipes/')
+        response = self.clients[0].delete(
+            f'/api/recipes/{self.recipes[0].pk}/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assert_changed(self.client, '/api/recipes/', etag)
+
+    def test_user_flags(self):
+        client = self.clients[1]
+        etag = self.assert_not_modified(client, '/api/recipes/')
+        client.post(f'/api/recipes/{self.recipes[0].pk}/favorite/')
+        self.assert_changed(client, '/api/recipes/', etag)
+
+
+class ShoppingCartTotalsTest(RecipesAPITestCase):
+    """Сводный список покупок совпадает с содержимым списков."""
+    def assert_totals(self):
+        live = {
+            (row['recipes__shopping_cart__user'], row['ingredients']):
+                row['amount']
+            for row in ShoppingCartTotals.objects.live_totals()
+        }
+        self.assertEqual(dict(
+            ((user, ingredient), amount) for user, ingredient, amount in
+            ShoppingCartTotals.objects.values_list(
+                'user', 'ingredients', 'amount'
+            )
+        ), live)
+        call_command('rebuild_shopping_cart_totals', check=True,
+                     stdout=io.StringIO())
+
+    def setUp(self):
+        super().setUp()
+        for client in self.clients[:2]:
+            for recipes in self.recipes[:4]:
+                client.post(f'/api/recipes/{recipes.pk}/shopping_cart/')
+        self.clients[2].post('/api/recipes/shopping_cart/', {
+            'recipes': [recipes.pk for recipes in self.recipes]
+        }, format='json')
+
+    def test_add_and_remove(self):
+        self.assert_totals()
+        # Сахар: 10 г из первого рецепта и 5 г из четвёртого.
+        self.assertEqual(ShoppingCartTotals.objects.get(
+            user=self.users[0], ingredients=self.ingredients[0]
+        ).amount, 15)
+        self.clients[0].delete(
+            f'/api/recipes/{self.recipes[0].pk}/shopping_cart/'
+        )
+        self.clients[2].delete('/api/recipes/shopping_cart/', {
+            'recipes': [recipes.pk for recipes in self.recipes[:3]]
+        }, format='json')
+        self.assert_totals()
+        self.assertEqual(ShoppingCartTotals.objects.get(
+            user=self.users[0], ingredients=self.ingredients[0]
+        ).amount, 5)
+
+    def test_update(self):
+        recipes = self.recipes[1]
+        response = self.clients[self.users.index(recipes.author)].patch(
+            f'/api/recipes/{recipes.pk}/', {'ingredients': [
+                {'id': self.ingredients[1].pk, 'amount': 100},
+                {'id': self.ingredients[3].pk, 'amount': 7},
+            ]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_totals()
+
+    def test_delete(self):
+        response = self.clients[0].delete(
+            f'/api/recipes/{self.recipes[0].pk}/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assert_totals()
+        # Удаление в админке и вместе с автором.
+        Recipes.objects.get(pk=self.recipes[2].pk).delete()
+        self.assert_totals()
+        User.objects.get(pk=self.users[1].pk).delete()
+        self.assert_totals()
+
+
+class ReconcileRecipeCountersTest(RecipesAPITestCase):
+    """Команда reconcile_recipe_counters исправляет счётчики рецептов."""
+    def reconcile(self, *args):
+        out = io.StringIO()
+        call_command('reconcile_recipe_counters', *args, stdout=out)
+        return out.getvalue()
+
+    def counters(self):
+        return {
+            recipes.pk: (recipes.favorites_count, recipes.in_carts_count)
+            for recipes in Recipes.objects.all()
+        }
+
+    def test_reconcile(self):
+        for client in self.clients:
+            client.post(f'/api/recipes/{self.recipes[0].pk}/favorite/')
+        self.clients[0].post(
+            f'/api/recipes/{self.recipes[1].pk}/shopping_cart/'
+        )
+        expected = self.counters()
+        # Записи и счётчики, изменённые в обход API.
+        Recipes.objects.filter(pk=self.recipes[0].pk).update(
+            favorites_count=7
+        )
+        ShoppingCart.objects.create(user=self.users[1],
+                                    recipes=self.recipes[1])
+        FavoriteRecipes.objects.create(user=self.users[0],
+                                       recipes=self.recipes[5])
+        expected[self.recipes[1].pk] = (0, 2)
+        expected[self.recipes[5].pk] = (1, 0)
+        unchanged = Recipes.objects.get(pk=self.recipes[3].pk).updated_at
+
+        with self.assertRaises(CommandError):
+            self.reconcile('--check')
+        self.assertNotEqual(self.counters(), expected)
+        self.assertIn('Рецептов с расхождениями: 3',
+                      self.reconcile('--batch-size', '2'))
+        self.assertEqual(self.counters(), expected)
+        self.assertIn('Рецептов с расхождениями: 0',
+                      self.reconcile('--check'))
+        self.assertEqual(
+            Recipes.objects.get(pk=self.recipes[3].pk).updated_at, unchanged
+        )
+
+
+@override_settings(FEED_MATERIALIZE_FOLLOWS=1)
+class FeedTest(RecipesAPITestCase):
+    """Хранимая лента подписок при подписке, отписке и публикации."""
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create(
+            username='author', email='author@example.com',
+            first_name='Имя', last_name='Фамилия'
+        )
+        self.create_recipes(self.author, 'Рецепт автора',
+                            {self.ingredients[0]: 1})
+
+    def subscribe(self, author, method='post'):
+        response = getattr(self.clients[0], method)(
+            f'/api/users/{author.pk}/subscribe/'
+        )
+        self.assertIn(response.status_code, (201, 204))
+
+    def entries(self):
+        return set(FeedEntry.objects.filter(
+            user=self.users[0]
+        ).values_list('recipes', flat=True))
+
+    def recipes_of(self, *authors):
+        return set(Recipes.objects.filter(
+            author__in=authors
+        ).values_list('pk', flat=True))
+
+    def feed(self):
+        response = self.clients[0].get('/api/recipes/feed/?limit=100')
+        self.assertEqual(response.status_code, 200)
+        return [recipes['id'] for recipes in response.data['results']]
+
+    def test_follow_and_unfollow(self):
+        self.subscribe(self.users[1])
+        self.assertEqual(self.entries(), set())
+        self.subscribe(self.users[2])
+        self.subscribe(self.author)
+        authors = (self.users[1], self.users[2], self.author)
+        self.assertEqual(self.entries(), self.recipes_of(*authors))
+        with override_settings(FEED_MATERIALIZE_FOLLOWS=0):
+            merged = self.feed()
+        self.assertEqual(self.feed(), merged)
+
+        self.subscribe(self.author, 'delete')
+        self.assertEqual(self.entries(),
+                         self.recipes_of(self.users[1], self.users[2]))
+        # Подписок больше не хватает для хранимой ленты.
+        self.subscribe(self.users[2], 'delete')
+        self.assertEqual(self.entries(), set())
+        self.assertEqual(set(self.feed()), self.recipes_of(self.users[1]))
+
+    def test_publish(self):
+        for author in (self.users[1], self.author):
+            self.subscribe(author)
+        recipes = self.create_recipes(self.author, 'Новый рецепт',
+                                      {self.ingredients[1]: 1})
+        self.assertIn(recipes.pk, self.entries())
+        self.assertEqual(self.feed()[0], recipes.pk)
+        # Лента других подписчиков автора не хранится.
+        self.clients[1].post(f'/api/users/{self.author.pk}/subscribe/')
+        self.create_recipes(self.author, 'Ещё рецепт',
+                            {self.ingredients[1]: 1})
+        self.assertFalse(FeedEntry.objects.filter(user=self.users[1]).exists())
+
+
+class IngredientsAutocompleteTest(RecipesAPITestCase):
+    """Поиск ингредиентов по началу названия и по подстроке."""
+    def names(self, query):
+        response = self.client.get('/api/ingredients/', {'name': query})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_prefix_first(self):
+        for name in ('тростниковый сахар', 'сахарная пудра', 'сало'):
+            Ingredients.objects.create(name=name, measurement_unit='г')
+        self.assertEqual(self.names('сах'), [
+            'сахар', 'сахарная пудра', 'тростниковый сахар'
+        ])
+        self.assertEqual(self.names('  САХАР '), [
+            'сахар', 'сахарная пудра', 'тростниковый сахар'
+        ])
+        self.assertEqual(self.names('са'), [
+            'сало', 'сахар', 'сахарная пудра', 'тростниковый сахар'
+        ])
+        self.assertEqual(self.names('перец'), [])
+        self.assertEqual(len(self.names('')),
+                         Ingredients.objects.count())
+
+    def test_changes(self):
+        self.assertEqual(self.names('сол'), ['соль'])
+        ingredient = Ingredients.objects.get(name='соль')
+        ingredient.name = 'соль морская'
+        ingredient.save()
+        self.assertEqual(self.names('сол'), ['соль морская'])
+        ingredient.delete()
+        self.assertEqual(self.names('сол'), [])
+
+    def test_detail(self):
+        ingredient = self.ingredients[0]
+        response = self.client.get(f'/api/ingredients/{ingredient.pk}/')
+        self.assertEqual(response.data['name'], ingredient.name)
+        self.assertEqual(self.client.get('/api/ingredients/0/').status_code,
+                         404)
+
+
+class RecipesIngredientsUpdateTest(RecipesAPITestCase):
+    """При изменении рецепта меняются только отличающиеся ингредиенты."""
+    def rows(self, recipes):
+        return {
+            ingredient: (pk, amount) for pk, ingredient, amount in
+            IngredientsForRecipes.objects.filter(recipes=recipes).values_list(
+                'pk', 'ingredients', 'amount'
+            )
+        }
+
+    def update(self, recipes, amounts):
+        response = self.clients[0].patch(
+            f'/api/recipes/{recipes.pk}/', {'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient, amount in amounts.items()
+            ]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {ingredient['id']: ingredient['amount']
+             for ingredient in response.data['ingredients']},
+            {ingredient.pk: amount for ingredient, amount in amounts.items()}
+        )
+        return response
+
+    def test_diff(self):
+        recipes = self.recipes[0]
+        sugar, flour, salt, _ = self.ingredients
+        before = self.rows(recipes)
+        self.update(recipes, {sugar: 10, flour: 50, salt: 3})
+        after = self.rows(recipes)
+        self.assertEqual(after[sugar.pk], before[sugar.pk])
+        self.assertEqual(after[flour.pk], (before[flour.pk][0], 50))
+        self.assertEqual(after[salt.pk][1], 3)
+
+        self.update(recipes, {salt: 3})
+        self.assertEqual(self.rows(recipes), {salt.pk: after[salt.pk]})
+
+    def test_unchanged(self):
+        recipes = self.recipes[0]
+        before = self.rows(recipes)
+        self.update(recipes, {
+            ingredient: amount for ingredient, amount in zip(
+                self.ingredients, (10, 5)
+            )
+        })
+        self.assertEqual(self.rows(recipes), before)
+
+    def test_invalid(self):
+        recipes = self.recipes[0]
+        before = self.rows(recipes)
+        sugar = self.ingredients[0]
+        for ingredients in (
+            [], [{'id': sugar.pk, 'amount': 0}],
+            [{'id': sugar.pk, 'amount': 1}, {'id': sugar.pk, 'amount': 2}],
+            [{'id': 0, 'amount': 1}], [{'amount': 1}],
+        ):
+            with self.subTest(ingredients=ingredients):
+                response = self.clients[0].patch(
+                    f'/api/recipes/{recipes.pk}/',
+                    {'ingredients': ingredients}, format='json'
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.rows(recipes), before)
+
+
+class PdfWrapTest(SimpleTestCase):
+    """Перенос строк PDF по ширине символов."""
+    @staticmethod
+    def char_width(char):
+        # 49 символов на строку.
+        return 10
+
+    def test_wrap(self):
+        words = ['слово'] * 20
+        parts = _wrap(' '.join(words), self.char_width)
+        self.assertEqual([len(part) for part in parts], [47, 47, 23])
+        self.assertEqual(' '.join(parts).split(' '), words)
+        self.assertEqual(_wrap('', self.char_width), [''])
+
+    def test_long_word(self):
+        self.assertEqual(_wrap('а' * 100 + ' б', self.char_width),
+                         ['а' * 49, 'а' * 49, 'аа б'])
+
+    def test_pages(self):
+        # Каждая строка переносится на две, страниц становится вдвое больше.
+        lines = ['слово ' * 20] * LINES_PER_PAGE
+        content = b''.join(iter_pdf(lines))
+        self.assertEqual(content.count(b'/Type /Page '), 2)
@@ -1,6 +1,7 @@
 from django.urls import include, path
 from rest_framework import routers
 
+from .metrics import metrics_view
 from .views import IngredientsViewSet, RecipesViewSet, TagsViewSet
 
 router_v1 = routers.DefaultRouter()
@@ -10,5 +11,6 @@ router_v1.register(r'recipes', RecipesViewSet)
 router_v1.register(r'ingredients', IngredientsViewSet)
 
 urlpatterns = [
+    path('metrics', metrics_view, name='metrics'),
     path('', include(router_v1.urls)),
 ]
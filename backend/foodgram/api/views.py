@@ -1,38 +1,62 @@
-from django.db.models import Sum
-from django.http import FileResponse
+from django.db.models import F
+from django.http import Http404, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from recipes.models import (FavoriteRecipes, Ingredients,
-                            IngredientsForRecipes, Recipes, ShoppingCart, Tags)
+from recipes.feed import is_materialized
+from recipes.models import (FavoriteRecipes, Ingredients, Recipes,
+                            ShoppingCart, Tags)
 from rest_framework import permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from .filters import IngredientsFilters, RecipesFilters
-from .mixins import CustomRecipeViewSet, ListRetrieveViewSet
-from .pagination import CustomPageNumberPagination
+from .autocomplete import ingredients_index
+from .filters import RecipesFilters
+from .metrics import measure_size
+from .mixins import (AnonymousCacheMixin, ConditionalGetMixin,
+                     CustomRecipeViewSet, ListRetrieveViewSet)
+from .pagination import CustomPageNumberPagination, FeedPagination
 from .permissions import AuthorAdminOrReadOnly
+from .renderers import SHOPPING_LIST_RENDERERS
 from .serializers import (FavoriteRecipesSerializer, IngredientsSerializer,
-                          RecipesSerializer, ShoppingCartSerializer,
-                          TagsSerializer)
+                          RecipesIdsSerializer, RecipesSerializer,
+                          ShoppingCartSerializer, TagsSerializer)
+from .shopping_list import export_shopping_list
 
 
-class TagsViewSet(ListRetrieveViewSet):
+class TagsViewSet(AnonymousCacheMixin, ListRetrieveViewSet):
     """Обрабатывает запросы по тегам."""
+    cache_group = 'tags'
     queryset = Tags.objects.all()
     serializer_class = TagsSerializer
     permission_classes = (permissions.AllowAny,)
 
 
-class IngredientsViewSet(ListRetrieveViewSet):
+class IngredientsViewSet(AnonymousCacheMixin, ListRetrieveViewSet):
     """Обрабатывает запросы по ингредиентам."""
+    cache_group = 'ingredients'
     queryset = Ingredients.objects.all()
     serializer_class = IngredientsSerializer
     permission_classes = (permissions.AllowAny,)
-    filter_backends = (IngredientsFilters,)
-    search_fields = ('^name',)
 
+    def list(self, request, *args, **kwargs):
+        ingredients = ingredients_index.search(
+            request.query_params.get('name', '')
+        )
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
+
+    def get_object(self):
+        try:
+            ingredient = ingredients_index.get(int(self.kwargs['pk']))
+        except ValueError:
+            ingredient = None
+        if ingredient is None:
+            raise Http404
+        self.check_object_permissions(self.request, ingredient)
+        return ingredient
 
-class RecipesViewSet(CustomRecipeViewSet):
+
+class RecipesViewSet(AnonymousCacheMixin, ConditionalGetMixin,
+                     CustomRecipeViewSet):
     """
     Обрабатывает запосы по рецептам.
     Добавлены методы для добавления рецепта в избранное,
@@ -40,11 +64,43 @@ class RecipesViewSet(CustomRecipeViewSet):
     """
     queryset = Recipes.objects.all()
     serializer_class = RecipesSerializer
+    cache_group = 'recipes'
     pagination_class = CustomPageNumberPagination
     filter_backends = (DjangoFilterBackend, )
     filter_class = RecipesFilters
     permission_classes = (AuthorAdminOrReadOnly,)
 
+    def get_queryset(self):
+        return Recipes.objects.with_related().annotate_user_flags(
+            self.request.user
+        )
+
+    def get_list_stamps(self):
+        # Отметки общие для всех фильтров: любое изменение рецептов
+        # меняет ETag любого списка. Дата изменения учитывается только
+        # в ETag: удаление рецепта её не меняет.
+        return (None, *self.get_recipes_stamps())
+
+    def get_object_stamps(self):
+        try:
+            updated_at = Recipes.objects.filter(
+                pk=self.kwargs['pk']
+            ).values_list('updated_at', flat=True).first()
+        except ValueError:
+            return None
+        if updated_at is None:
+            return None
+        return (updated_at,)
+
+    def perform_create(self, serializer):
+        serializer.save()
+        serializer.instance = self.get_queryset().get(
+            pk=serializer.instance.pk
+        )
+
+    def perform_update(self, serializer):
+        self.perform_create(serializer)
+
     @action(
         detail=True, methods=['post', 'delete'],
         permission_classes=[permissions.IsAuthenticated]
@@ -77,24 +133,87 @@ class RecipesViewSet(CustomRecipeViewSet):
             )
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
-    @action(detail=False, permission_classes=[permissions.IsAuthenticated])
-    def download_shopping_cart(self, request):
-        user = request.user
-        shopping_list = 'Список покупок:\n '
-        ingredients = IngredientsForRecipes.objects.filter(
-            recipes__shopping_cart__user=user).values(
-                'ingredients__name',
-                'ingredients__measurement_unit').order_by(
-                    'ingredients__name').annotate(amount=Sum('amount'))
-        for ingredient in ingredients:
-            shopping_list = (
-                f"{shopping_list}\n" + f"{ingredient['ingredients__name']} "
-                + " -"
-                f" {ingredient['amount']} "
-                f"{ingredient['ingredients__measurement_unit']}; "
+    def bulk_change(self, request, model, serializers):
+        serializer = RecipesIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.validated_data['recipes']
+        if request.method == 'POST':
+            return self.adding_objects(model=model, serializers=serializers,
+                                       user=request.user, recipes=recipes)
+        return self.deleting_objects(model=model, user=request.user,
+                                     recipes=recipes)
+
+    @action(
+        detail=False, methods=['post', 'delete'], url_path='favorite',
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def bulk_favorite(self, request):
+        """Добавляет в избранное или удаляет из него список рецептов."""
+        return self.bulk_change(request, FavoriteRecipes,
+                                FavoriteRecipesSerializer)
+
+    @action(
+        detail=False, methods=['post', 'delete'], url_path='shopping_cart',
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def bulk_shopping_cart(self, request):
+        """Добавляет в список покупок или удаляет из него рецепты."""
+        return self.bulk_change(request, ShoppingCart,
+                                ShoppingCartSerializer)
+
+    @action(detail=False)
+    def trending(self, request):
+        return self.cached_response(self.list_trending, request)
+
+    def list_trending(self, request):
+        """Рецепты по убыванию рейтинга, рассчитанного заранее."""
+        queryset = self.filter_queryset(self.get_queryset()).annotate(
+            trending_score=F('score__score')
+        ).filter(trending_score__isnull=False).order_by(
+            '-trending_score', '-id'
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, permission_classes=[permissions.IsAuthenticated],
+            pagination_class=FeedPagination)
+    def feed(self, request):
+        """Рецепты авторов из подписок пользователя, новые первыми."""
+        authors = list(request.user.follower.values_list('author',
+                                                         flat=True))
+        queryset = self.filter_queryset(self.get_queryset())
+        if is_materialized(len(authors)):
+            queryset = queryset.filter(
+                feed_entries__user=request.user
+            ).annotate(
+                feed_pub_date=F('feed_entries__pub_date')
+            ).order_by('-feed_pub_date', '-id')
+        else:
+            self.feed_authors = authors
+            queryset = queryset.filter(author__in=authors).order_by(
+                '-pub_date', '-id'
             )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
-        return FileResponse(
-            shopping_list, as_attachment=True, filename='ShoppingList.txt',
-            content_type='text/plain;charset=UTF-8'
+    @action(detail=False, permission_classes=[permissions.IsAuthenticated],
+            renderer_classes=SHOPPING_LIST_RENDERERS)
+    def download_shopping_cart(self, request):
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if content_type.startswith('text/'):
+            content_type += ';charset=UTF-8'
+        response = StreamingHttpResponse(
+            measure_size(
+                export_shopping_list(request.user, renderer.format),
+                'foodgram_shopping_list_export_bytes',
+                {'format': renderer.format}
+            ),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="ShoppingList.{renderer.format}"'
         )
+        return response
@@ -0,0 +1,105 @@
+"""
+ASGI config for foodgram project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+Django 2.2 has no ASGI handler, so the WSGI application is wrapped in
+BufferedWsgiToAsgi. The request body is received by the event loop
+before a thread is taken; the view runs in a thread pool of ASGI_THREADS
+threads and writes the response into a temporary file, which the event
+loop then sends to the client. A slow client therefore holds only a
+coroutine, not a thread with a database connection.
+
+Django's own handler is used from 4.1 on, once views and the ORM have
+async interfaces: under earlier versions it runs every sync view in a
+single thread per process.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache
+from tempfile import SpooledTemporaryFile
+
+import django
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_SIZE = 1024 * 1024
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    from django.conf import settings
+    return ThreadPoolExecutor(max_workers=settings.ASGI_THREADS,
+                              thread_name_prefix='asgi')
+
+
+class BufferedWsgiToAsgiInstance(WsgiToAsgiInstance):
+    """Один запрос: WSGI-приложение в потоке, отправка ответа в цикле."""
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            raise ValueError('Поддерживаются только HTTP-запросы.')
+        self.scope = scope
+        with ExitStack() as stack:
+            body, output = (
+                stack.enter_context(SpooledTemporaryFile(max_size=SPOOL_SIZE))
+                for _ in range(2)
+            )
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            await sync_to_async(
+                self.render, thread_sensitive=False,
+                executor=get_executor()
+            )(body, output)
+            await send(self.response_start)
+            while True:
+                chunk = output.read(CHUNK_SIZE)
+                await send({'type': 'http.response.body', 'body': chunk,
+                            'more_body': bool(chunk)})
+                if not chunk:
+                    break
+
+    def render(self, body, output):
+        """Выполняет приложение и записывает тело ответа в output."""
+        result = self.wsgi_application(self.build_environ(self.scope, body),
+                                       self.start_response)
+        try:
+            for chunk in result:
+                output.write(chunk)
+        finally:
+            # close() отправляет request_finished: соединения с базой
+            # закрываются в том же потоке, где были открыты.
+            if hasattr(result, 'close'):
+                result.close()
+        output.seek(0)
+
+
+class BufferedWsgiToAsgi:
+    """WSGI-приложение как ASGI-приложение с буферизацией ответа."""
+    def __init__(self, wsgi_application):
+        self.wsgi_application = wsgi_application
+
+    async def __call__(self, scope, receive, send):
+        await BufferedWsgiToAsgiInstance(self.wsgi_application)(
+            scope, receive, send
+        )
+
+
+if django.VERSION >= (4, 1):
+    from django.core.asgi import get_asgi_application
+
+    application = get_asgi_application()
+else:
+    from django.core.wsgi import get_wsgi_application
+
+    application = BufferedWsgiToAsgi(get_wsgi_application())
@@ -0,0 +1,29 @@
+"""
+Пулы соединений процесса, которые создаёт бэкенд foodgram.db.pooled,
+и их статистика для инструментирования и метрик.
+"""
+import os
+import threading
+
+STATS = ('opened', 'checkouts', 'waits', 'timeouts')
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def get_pool(alias, create):
+    """Пул соединения alias текущего процесса (после fork — новый)."""
+    key = (alias, os.getpid())
+    with _lock:
+        if key not in _pools:
+            _pools[key] = create()
+        return _pools[key]
+
+
+def pool_stats():
+    """Статистика пулов текущего процесса по псевдонимам баз."""
+    pid = os.getpid()
+    with _lock:
+        pools = [(alias, pool) for (alias, owner), pool in _pools.items()
+                 if owner == pid]
+    return {alias: pool.snapshot() for alias, pool in pools}
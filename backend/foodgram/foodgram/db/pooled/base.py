@@ -0,0 +1,105 @@
+"""
+Бэкенд PostgreSQL с пулом соединений в памяти процесса.
+
+Включается DB_ENGINE=foodgram.db.pooled. Django при закрытии соединения
+(в конце запроса при DB_CONN_MAX_AGE = 0) возвращает его в пул,
+и следующий запрос любого потока процесса получает готовое соединение
+без TCP-рукопожатия и аутентификации. Открытыми держатся DB_POOL_SIZE
+соединений; при нагрузке пул открывает дополнительные, всего не больше
+DB_POOL_MAX_SIZE, и закрывает их при возврате. Если все соединения
+заняты, запрос ждёт свободное не дольше DB_POOL_TIMEOUT секунд.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db.backends.postgresql.base import Database
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+from ..pool import STATS, get_pool
+from ..postgresql import base
+
+
+class ConnectionPool(ThreadedConnectionPool):
+    """ThreadedConnectionPool с ожиданием свободного соединения и учётом."""
+    def __init__(self, minconn, maxconn, timeout, **kwargs):
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.timeout = timeout
+        self.stats_lock = threading.Lock()
+        self.stats = dict.fromkeys(STATS, 0)
+        self.wait_seconds = 0.0
+        super().__init__(minconn, maxconn, **kwargs)
+
+    def _count(self, name, wait=0.0):
+        with self.stats_lock:
+            self.stats[name] += 1
+            self.wait_seconds += wait
+
+    def _connect(self, key=None):
+        self._count('opened')
+        return super()._connect(key)
+
+    def acquire(self):
+        start = time.perf_counter()
+        if not self.slots.acquire(blocking=False):
+            self._count('waits')
+            if not self.slots.acquire(timeout=self.timeout):
+                self._count('timeouts')
+                raise PoolError('Нет свободных соединений с базой.')
+        try:
+            connection = self.getconn()
+        except Exception:
+            self.slots.release()
+            raise
+        self._count('checkouts', time.perf_counter() - start)
+        return connection
+
+    def release(self, connection, close=False):
+        try:
+            self.putconn(connection, close=close)
+        finally:
+            self.slots.release()
+
+    def snapshot(self):
+        """Занятые и свободные соединения и счётчики с запуска процесса."""
+        with self._lock:
+            used, idle = len(self._used), len(self._pool)
+        with self.stats_lock:
+            return {'used': used, 'idle': idle, **self.stats,
+                    'wait_ms': round(self.wait_seconds * 1000, 2)}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(self.alias, lambda: ConnectionPool(
+            settings.DB_POOL_SIZE, settings.DB_POOL_MAX_SIZE,
+            settings.DB_POOL_TIMEOUT, **conn_params
+        ))
+        connection = self.pool.acquire()
+        if settings.DB_CONN_HEALTH_CHECKS and not self._is_alive(connection):
+            self.pool.release(connection, close=True)
+            connection = self.pool.acquire()
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get('isolation_level',
+                                           connection.isolation_level)
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    @staticmethod
+    def _is_alive(connection):
+        """Соединение из пула могло быть закрыто сервером."""
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except Database.Error:
+            return False
+        return True
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.release(self.connection,
+                                  close=bool(self.connection.closed))
@@ -0,0 +1,39 @@
+"""
+Бэкенд PostgreSQL с проверкой переиспользуемых соединений.
+
+Включается DB_ENGINE=foodgram.db.postgresql. Соединение, пережившее
+предыдущий запрос (DB_CONN_MAX_AGE > 0), проверяется один раз перед
+первым SQL-запросом следующего; если сервер его закрыл (перезапуск
+базы, таймаут простоя), открывается новое. Запросы, которые не
+обращаются к базе (ответы из кэша), соединение не проверяют. Так же
+работает CONN_HEALTH_CHECKS в Django 4.1.
+"""
+from django.conf import settings
+from django.db.backends.postgresql import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    health_check_done = False
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # Вызывается в начале и в конце запроса: соединение, которое
+        # остаётся открытым, будет проверено перед следующим SQL-запросом.
+        self.health_check_done = False
+
+    def close_if_health_check_failed(self):
+        if (self.connection is None or self.health_check_done
+                or self.in_atomic_block
+                or not settings.DB_CONN_HEALTH_CHECKS):
+            return
+        self.health_check_done = True
+        if not self.is_usable():
+            self.close()
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
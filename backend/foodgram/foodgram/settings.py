@@ -36,6 +36,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,15 +73,32 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
+        'ENGINE': os.getenv('DB_ENGINE', default='foodgram.db.postgresql'),
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default=''),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
     }
 }
 
+# Соединение с базой живёт DB_CONN_MAX_AGE секунд и переиспользуется
+# следующими запросами; 0 — новое соединение на каждый запрос. С
+# DB_CONN_HEALTH_CHECKS бэкенды foodgram.db.postgresql и foodgram.db.pooled
+# проверяют переиспользуемое соединение перед первым SQL-запросом
+# и, если сервер его закрыл, открывают заново.
+DB_CONN_HEALTH_CHECKS = os.getenv(
+    'DB_CONN_HEALTH_CHECKS', default='True'
+).lower() in ('1', 'true', 'yes')
+
+# Пул соединений процесса для DB_ENGINE=foodgram.db.pooled (потоковые
+# воркеры, ASGI): DB_POOL_SIZE соединений держится открытыми, всего
+# не больше DB_POOL_MAX_SIZE, ожидание свободного — до DB_POOL_TIMEOUT с.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', default=4))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', default=16))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', default=10))
+
 AUTH_USER_MODEL = 'users.User'
 
 # Password validation
@@ -154,3 +173,103 @@ DJOSER = {
         'user_list': ('rest_framework.permissions.AllowAny',)
     }
 }
+
+# Шрифт TrueType с кириллицей для выгрузки списка покупок в PDF.
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Время (в секундах), через которое индекс ингредиентов в памяти
+# перечитывается из базы; изменения в текущем процессе применяются сразу.
+INGREDIENTS_INDEX_TTL = int(os.getenv('INGREDIENTS_INDEX_TTL', default=300))
+
+# Конфигурация полнотекстового поиска PostgreSQL для рецептов.
+RECIPES_SEARCH_CONFIG = os.getenv('RECIPES_SEARCH_CONFIG', default='russian')
+
+# Время (в секундах), через которое обратный индекс рецептов в памяти
+# (поиск без PostgreSQL) перечитывается из базы; изменения в текущем
+# процессе применяются сразу.
+RECIPES_INDEX_TTL = int(os.getenv('RECIPES_INDEX_TTL', default=300))
+
+# Кэш ответов API для анонимных пользователей. По умолчанию — память
+# процесса; для нескольких воркеров укажите общий бэкенд, например
+# django.core.cache.backends.filebased.FileBasedCache с каталогом
+# или django_redis.cache.RedisCache (пакет django-redis) с адресом Redis.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', default=300))
+
+# Обработка изображений рецептов: наибольшая допустимая сторона (px),
+# качество WebP/JPEG копий и число потоков для их построения
+# (0 — строить сразу после сохранения рецепта, в потоке запроса).
+RECIPES_IMAGE_MAX_SIDE = int(os.getenv('RECIPES_IMAGE_MAX_SIDE', default=6000))
+RECIPES_IMAGE_QUALITY = int(os.getenv('RECIPES_IMAGE_QUALITY', default=80))
+RECIPES_IMAGE_WORKERS = int(os.getenv('RECIPES_IMAGE_WORKERS', default=2))
+
+# Период полураспада вклада добавлений в рейтинг «в тренде», часов.
+TRENDING_HALF_LIFE_HOURS = float(
+    os.getenv('TRENDING_HALF_LIFE_HOURS', default=48)
+)
+
+# Ленты подписок пользователей, у которых подписок больше
+# FEED_MATERIALIZE_FOLLOWS, хранятся в таблице FeedEntry; для остальных
+# лента собирается при запросе. 0 отключает хранение лент.
+FEED_MATERIALIZE_FOLLOWS = int(
+    os.getenv('FEED_MATERIALIZE_FOLLOWS', default=200)
+)
+
+# Число потоков, выполняющих представления при запуске через ASGI
+# (foodgram.asgi). Каждый поток держит своё соединение с базой.
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', default=16))
+
+# Учёт SQL-запросов и времени ответа (заголовок Server-Timing и журнал
+# api.instrumentation). Медленные запросы (дольше SLOW_REQUEST_MS)
+# журналируются с долей выборки SLOW_REQUEST_SAMPLE_RATE вместе
+# с SLOW_REQUEST_TOP_SQL самыми затратными SQL.
+QUERY_INSTRUMENTATION = os.getenv(
+    'QUERY_INSTRUMENTATION', default='False'
+).lower() in ('1', 'true', 'yes')
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', default=500))
+SLOW_REQUEST_SAMPLE_RATE = float(
+    os.getenv('SLOW_REQUEST_SAMPLE_RATE', default=0.1)
+)
+SLOW_REQUEST_TOP_SQL = int(os.getenv('SLOW_REQUEST_TOP_SQL', default=5))
+
+# Метрики для /api/metrics. Каждый процесс сбрасывает свои значения
+# в METRICS_DIR не чаще раза в METRICS_FLUSH_INTERVAL секунд; значения
+# завершившихся процессов складываются в METRICS_DIR/exited.json. Эндпоинт
+# доступен с заголовком Authorization: Bearer <METRICS_TOKEN> или
+# администратору, вошедшему в админку; без токена сборщик метрик
+# получит 403.
+METRICS_ENABLED = os.getenv(
+    'METRICS_ENABLED', default='True'
+).lower() in ('1', 'true', 'yes')
+METRICS_DIR = os.getenv('METRICS_DIR', default='/tmp/foodgram-metrics')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', default=5))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.instrumentation': {
+            'handlers': ['console'],
+            'level': os.getenv('INSTRUMENTATION_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+    },
+}
@@ -1,7 +1,9 @@
 from django.contrib import admin
 
+from .images import schedule_renditions
 from .models import (FavoriteRecipes, Ingredients, IngredientsForRecipes,
                      Recipes, ShoppingCart, Tags)
+from .search import update_search_vector
 
 
 class TagsAdmin(admin.ModelAdmin):
@@ -25,7 +27,19 @@ class RecipesAdmin(admin.ModelAdmin):
     inlines = [IngredientsInLine]
 
     def favorite(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
+    favorite.admin_order_field = 'favorites_count'
+
+    def save_model(self, request, obj, form, change):
+        if 'image' in form.changed_data:
+            obj.images_ready = False
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        update_search_vector(form.instance.pk)
+        if 'image' in form.changed_data:
+            schedule_renditions(form.instance)
 
 
 class ShoppingCartAdmin(admin.ModelAdmin):
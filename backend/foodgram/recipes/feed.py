@@ -0,0 +1,77 @@
+"""
+Лента подписок: рецепты авторов, на которых подписан пользователь.
+
+Для большинства пользователей лента собирается при запросе слиянием
+рецептов авторов по индексу (author, -pub_date, -id). Пользователям
+с числом подписок больше FEED_MATERIALIZE_FOLLOWS лента хранится
+в таблице FeedEntry: она пополняется при публикации рецепта
+и при подписке и читается по индексу (user, -pub_date).
+"""
+from django.conf import settings
+from django.db.models import Count
+from users.models import Follow
+
+from .models import FeedEntry, Recipes
+
+
+def is_materialized(follows_count):
+    limit = settings.FEED_MATERIALIZE_FOLLOWS
+    return bool(limit) and follows_count > limit
+
+
+def _entries(user_id, recipes):
+    return (
+        FeedEntry(user_id=user_id, recipes_id=recipes_id, pub_date=pub_date)
+        for recipes_id, pub_date in recipes.values_list(
+            'pk', 'pub_date'
+        ).iterator()
+    )
+
+
+def rebuild_feed(user_id, batch_size=500):
+    """Заново заполняет хранимую ленту пользователя."""
+    FeedEntry.objects.filter(user_id=user_id).delete()
+    FeedEntry.objects.bulk_create(_entries(user_id, Recipes.objects.filter(
+        author__following__user_id=user_id
+    )), batch_size=batch_size)
+
+
+def follow_added(user_id, author_id):
+    follows = Follow.objects.filter(user_id=user_id).count()
+    if not is_materialized(follows):
+        return
+    if not is_materialized(follows - 1):
+        rebuild_feed(user_id)
+        return
+    FeedEntry.objects.bulk_create(_entries(user_id, Recipes.objects.filter(
+        author_id=author_id
+    )), ignore_conflicts=True)
+
+
+def follow_removed(user_id, author_id):
+    entries = FeedEntry.objects.filter(user_id=user_id)
+    if is_materialized(Follow.objects.filter(user_id=user_id).count()):
+        entries = entries.filter(recipes__author_id=author_id)
+    entries.delete()
+
+
+def recipe_published(recipes):
+    """Добавляет новый рецепт в хранимые ленты подписчиков автора."""
+    limit = settings.FEED_MATERIALIZE_FOLLOWS
+    if not limit:
+        return
+    # Подписки считаются только у подписчиков автора (по индексу
+    # unique_follow), а не группировкой всей таблицы Follow.
+    followers = Follow.objects.filter(
+        author_id=recipes.author_id
+    ).values('user')
+    heavy_users = Follow.objects.filter(user__in=followers).values(
+        'user'
+    ).order_by().annotate(
+        follows=Count('pk')
+    ).filter(follows__gt=limit).values_list('user', flat=True)
+    FeedEntry.objects.bulk_create((
+        FeedEntry(user_id=user_id, recipes=recipes,
+                  pub_date=recipes.pub_date)
+        for user_id in heavy_users
+    ), ignore_conflicts=True)
@@ -0,0 +1,236 @@
+"""
+Обработка изображений рецептов.
+
+Изображение из base64 декодируется частями во временный файл, после чего
+проверяются его формат и размеры. Уменьшенные копии (миниатюра, карточка,
+страница рецепта) в форматах WebP и JPEG строятся в пуле потоков после
+фиксации транзакции, пока запрос уже обработан.
+"""
+import base64
+import binascii
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps, features
+
+from .models import Recipes
+
+logger = logging.getLogger(__name__)
+
+# Размер, способ масштабирования: fit — обрезка до точного размера,
+# thumbnail — вписывание в размер с сохранением пропорций.
+RENDITIONS = {
+    'thumbnail': ((160, 160), 'fit'),
+    'card': ((480, 480), 'thumbnail'),
+    'detail': ((1200, 1200), 'thumbnail'),
+}
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+ALLOWED_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+RENDITIONS_DIR = 'recipes/renditions'
+CHUNK_SIZE = 64 * 1024
+
+
+class ImageError(ValueError):
+    """Изображение не удалось декодировать или оно не прошло проверку."""
+
+
+def decode_base64_image(data):
+    """
+    Декодирует строку вида data:image/...;base64,... во временный файл
+    и проверяет изображение. Возвращает File, готовый к сохранению.
+    """
+    try:
+        header, encoded = data.split(';base64,', 1)
+    except ValueError as error:
+        raise ImageError('Неверный формат изображения.') from error
+    if not header.startswith('data:image'):
+        raise ImageError('Неверный формат изображения.')
+    content = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    try:
+        encoded = ''.join(encoded.split())
+        for start in range(0, len(encoded), CHUNK_SIZE):
+            content.write(base64.b64decode(
+                encoded[start:start + CHUNK_SIZE], validate=True
+            ))
+    except (binascii.Error, ValueError) as error:
+        content.close()
+        raise ImageError('Неверная кодировка изображения.') from error
+    content.seek(0)
+    try:
+        extension = validate_image(content)
+    except ImageError:
+        content.close()
+        raise
+    content.seek(0)
+    return File(content, name=f'image.{extension}')
+
+
+def validate_image(file):
+    """
+    Проверяет формат и размеры изображения по заголовку файла,
+    не декодируя его целиком. Возвращает расширение файла.
+    """
+    try:
+        with Image.open(file) as image:
+            image_format, (width, height) = image.format, image.size
+    except (OSError, Image.DecompressionBombError) as error:
+        raise ImageError('Файл не является изображением.') from error
+    if image_format not in ALLOWED_FORMATS:
+        raise ImageError(f'Формат {image_format} не поддерживается.')
+    max_side = settings.RECIPES_IMAGE_MAX_SIDE
+    if width > max_side or height > max_side:
+        raise ImageError(
+            f'Размер изображения не должен превышать {max_side}px.'
+        )
+    return ALLOWED_FORMATS[image_format]
+
+
+def rendition_name(image_name, size, extension):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{RENDITIONS_DIR}/{stem}_{size}.{extension}'
+
+
+def rendition_names(image_name):
+    """Имена файлов всех уменьшенных копий: {размер: {формат: имя}}."""
+    return {
+        size: {
+            extension: rendition_name(image_name, size, extension)
+            for extension in available_formats()
+        }
+        for size in RENDITIONS
+    }
+
+
+def available_formats():
+    if features.check('webp'):
+        return FORMATS
+    return {'jpeg': FORMATS['jpeg']}
+
+
+def _resize(image, size, method):
+    if method == 'fit':
+        return ImageOps.fit(image, size, Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    return image
+
+
+def _encode(image, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        image = image.convert('RGBA')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, image_format,
+               quality=settings.RECIPES_IMAGE_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def _load_original(image_name):
+    storage = Recipes._meta.get_field('image').storage
+    with storage.open(image_name) as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGB', 'RGBA'):
+            return image
+        return image.convert('RGBA')
+
+
+def build_renditions(image_name, storage=default_storage, force=False):
+    """
+    Строит и сохраняет уменьшенные копии изображения. Имя изображения
+    определяется его содержимым, поэтому готовые копии не перестраиваются
+    без force.
+    """
+    names = [
+        name for formats in rendition_names(image_name).values()
+        for name in formats.values()
+    ]
+    if not force and all(storage.exists(name) for name in names):
+        return
+    # Копии строятся от большей к меньшей, каждая следующая
+    # уменьшается из предыдущей, а не из оригинала.
+    source = _load_original(image_name)
+    for size, ((width, height), method) in sorted(
+        RENDITIONS.items(), key=lambda item: -item[1][0][0]
+    ):
+        image = _resize(source, (width, height), method)
+        if method == 'thumbnail':
+            source = image
+        for extension, image_format in available_formats().items():
+            name = rendition_name(image_name, size, extension)
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, ContentFile(_encode(image, image_format)))
+
+
+def process_recipe_image(recipes_id, image_name, force=False):
+    """
+    Строит копии изображения рецепта и отмечает их готовность, если
+    за это время изображение рецепта не заменили.
+    """
+    try:
+        build_renditions(image_name, force=force)
+        with transaction.atomic():
+            recipes = Recipes.objects.select_for_update().filter(
+                pk=recipes_id, image=image_name
+            ).first()
+            if recipes is not None:
+                recipes.images_ready = True
+                recipes.save(update_fields=['images_ready', 'updated_at'])
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', image_name)
+
+
+def _process_in_worker(*args):
+    try:
+        process_recipe_image(*args)
+    finally:
+        # У каждого потока пула своё соединение с базой.
+        connection.close()
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.RECIPES_IMAGE_WORKERS,
+        thread_name_prefix='recipes-images',
+    )
+
+
+def schedule_renditions(recipes):
+    """
+    Ставит построение копий изображения в очередь после фиксации
+    транзакции. При RECIPES_IMAGE_WORKERS = 0 копии строятся сразу.
+    """
+    args = (recipes.pk, recipes.image.name)
+    if not settings.RECIPES_IMAGE_WORKERS:
+        transaction.on_commit(lambda: process_recipe_image(*args))
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(_process_in_worker, *args)
+    )
+
+
+def rendition_urls(recipes, request=None):
+    """Адреса уменьшенных копий или None, пока они не построены."""
+    if not recipes.images_ready or not recipes.image:
+        return None
+    urls = {}
+    for size, names in rendition_names(recipes.image.name).items():
+        urls[size] = {}
+        for extension, name in names.items():
+            url = default_storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[size][extension] = url
+    return urls
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from recipes.images import process_recipe_image
+from recipes.models import Recipes
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии изображений рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Перестроить копии всех рецептов.')
+
+    def handle(self, *args, **options):
+        recipes = Recipes.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(images_ready=False)
+        total = 0
+        for pk, image in recipes.values_list('pk', 'image').iterator():
+            process_recipe_image(pk, image, force=options['all'])
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f'Обработано рецептов: {total}'))
@@ -0,0 +1,66 @@
+import posixpath
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from recipes.images import RENDITIONS_DIR, rendition_names
+from recipes.models import Recipes
+from recipes.storage import image_references
+
+
+class Command(BaseCommand):
+    help = ('Удаляет изображения рецептов и их уменьшенные копии, '
+            'на которые не ссылается ни один рецепт.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать файлы для удаления.')
+        parser.add_argument('--grace', type=int, default=24,
+                            help='Не трогать файлы моложе стольких часов '
+                                 '(по умолчанию 24).')
+
+    def walk(self, storage, directory):
+        directories, files = storage.listdir(directory)
+        for name in files:
+            yield posixpath.join(directory, name)
+        for name in directories:
+            yield from self.walk(storage, posixpath.join(directory, name))
+
+    def handle(self, *args, **options):
+        field = Recipes._meta.get_field('image')
+        references = image_references(Recipes.objects.all())
+        keep = set(references)
+        for name in references:
+            keep.update(
+                rendition for formats in rendition_names(name).values()
+                for rendition in formats.values()
+            )
+        shared = sum(1 for count in references.values() if count > 1)
+        self.stdout.write(f'Изображений у рецептов: {len(references)}, '
+                          f'из них общих для нескольких рецептов: {shared}')
+        deadline = timezone.now() - timedelta(hours=options['grace'])
+        removed = freed = 0
+        for storage, directory in ((field.storage, field.upload_to),
+                                   (default_storage, RENDITIONS_DIR)):
+            directory = directory.rstrip('/')
+            if not storage.exists(directory):
+                continue
+            for name in self.walk(storage, directory):
+                if name in keep or (
+                    directory != RENDITIONS_DIR
+                    and name.startswith(RENDITIONS_DIR + '/')
+                ):
+                    continue
+                if storage.get_modified_time(name) > deadline:
+                    continue
+                removed += 1
+                freed += storage.size(name)
+                if options['dry_run']:
+                    self.stdout.write(name)
+                else:
+                    storage.delete(name)
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {removed}, {freed / 1024 / 1024:.1f} МБ'
+        ))
@@ -0,0 +1,155 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import (FavoriteRecipes, Ingredients,
+                            IngredientsForRecipes, Recipes, ShoppingCart, Tags)
+from recipes.search import update_search_vector
+from users.models import Follow, User
+
+USERNAME_PREFIX = 'bench_user_'
+PASSWORD = 'bench-password'
+IMAGE = 'recipes/temp.png'
+WORDS = ('суп', 'салат', 'пирог', 'каша', 'соус', 'рагу', 'запеканка',
+         'омлет', 'блины', 'плов', 'томатный', 'куриный', 'грибной',
+         'овощной', 'сырный', 'домашний', 'быстрый', 'летний')
+
+
+class Command(BaseCommand):
+    help = ('Создаёт синтетические данные для нагрузочного тестирования: '
+            'пользователей, рецепты, подписки, избранное и списки покупок.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100,
+                            help='Число пользователей.')
+        parser.add_argument('--recipes', type=int, default=1000,
+                            help='Число рецептов.')
+        parser.add_argument('--ingredients', type=int, default=8,
+                            help='Число ингредиентов в рецепте.')
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Число подписок у пользователя.')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Число избранных рецептов у пользователя.')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Число рецептов в списке покупок.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Начальное значение генератора.')
+        parser.add_argument('--clear', action='store_true',
+                            help='Удалить ранее созданные данные.')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        if options['clear']:
+            deleted, _ = User.objects.filter(
+                username__startswith=USERNAME_PREFIX
+            ).delete()
+            self.stdout.write(f'Удалено объектов: {deleted}')
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            recipes = self.create_recipes(users, options['recipes'],
+                                          options['ingredients'])
+            self.create_relations(Follow, 'author', users, users,
+                                  options['follows'])
+            self.create_relations(FavoriteRecipes, 'recipes', users, recipes,
+                                  options['favorites'])
+            self.create_relations(ShoppingCart, 'recipes', users, recipes,
+                                  options['cart'])
+        call_command('rebuild_shopping_cart_totals', stdout=self.stdout)
+        call_command('reconcile_recipe_counters', stdout=self.stdout)
+        update_search_vector()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей: {len(users)}, рецептов: {len(recipes)}. '
+            f'Пароль пользователей: {PASSWORD}'
+        ))
+
+    def create_users(self, count):
+        start = User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).count()
+        last_id = self.last_id(User)
+        password = make_password(PASSWORD)
+        User.objects.bulk_create((
+            User(username=f'{USERNAME_PREFIX}{number}',
+                 email=f'{USERNAME_PREFIX}{number}@example.com',
+                 first_name='Пользователь', last_name=str(number),
+                 password=password)
+            for number in range(start, start + count)
+        ), batch_size=self.batch_size)
+        return list(User.objects.filter(
+            id__gt=last_id, username__startswith=USERNAME_PREFIX
+        ).values_list('id', flat=True))
+
+    @staticmethod
+    def last_id(model):
+        return model.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+
+    def get_ingredients(self):
+        ingredients = list(Ingredients.objects.values_list('id', flat=True))
+        if ingredients:
+            return ingredients
+        Ingredients.objects.bulk_create(
+            Ingredients(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(500)
+        )
+        return list(Ingredients.objects.values_list('id', flat=True))
+
+    def get_tags(self):
+        tags = list(Tags.objects.values_list('id', flat=True))
+        if tags:
+            return tags
+        Tags.objects.bulk_create(
+            Tags(name=name, color=color, slug=slug) for name, color, slug in (
+                ('Завтрак', '#E26C2D', 'breakfast'),
+                ('Обед', '#49B64E', 'lunch'),
+                ('Ужин', '#8775D2', 'dinner'),
+            )
+        )
+        return list(Tags.objects.values_list('id', flat=True))
+
+    def create_recipes(self, users, count, ingredients_count):
+        ingredients, tags = self.get_ingredients(), self.get_tags()
+        last_id = self.last_id(Recipes)
+        Recipes.objects.bulk_create((
+            Recipes(
+                author_id=self.random.choice(users),
+                name=' '.join(self.random.sample(WORDS, 3)).capitalize(),
+                text=' '.join(self.random.choices(WORDS, k=40)),
+                image=IMAGE,
+                cooking_time=self.random.randint(5, 180),
+            ) for _ in range(count)
+        ), batch_size=self.batch_size)
+        recipes = list(Recipes.objects.filter(id__gt=last_id).values_list(
+            'id', flat=True
+        ))
+        Recipes.tags.through.objects.bulk_create((
+            Recipes.tags.through(recipes_id=recipe, tags_id=tag)
+            for recipe in recipes
+            for tag in self.random.sample(tags, self.random.randint(
+                1, len(tags)
+            ))
+        ), batch_size=self.batch_size)
+        IngredientsForRecipes.objects.bulk_create((
+            IngredientsForRecipes(recipes_id=recipe, ingredients_id=ingredient,
+                                  amount=self.random.randint(1, 500))
+            for recipe in recipes
+            for ingredient in self.random.sample(
+                ingredients, min(ingredients_count, len(ingredients))
+            )
+        ), batch_size=self.batch_size)
+        return recipes
+
+    def create_relations(self, model, field, users, targets, count):
+        """Каждому пользователю — count случайных объектов из targets."""
+        model.objects.bulk_create((
+            model(user_id=user, **{f'{field}_id': target})
+            for user in users
+            for target in self.random.sample(
+                targets, min(count, len(targets))
+            ) if target != user or field != 'author'
+        ), batch_size=self.batch_size, ignore_conflicts=True)
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from recipes.feed import rebuild_feed
+from recipes.models import FeedEntry
+from users.models import Follow
+
+
+class Command(BaseCommand):
+    help = ('Заново заполняет хранимые ленты подписок пользователей '
+            'с числом подписок больше FEED_MATERIALIZE_FOLLOWS '
+            'и удаляет ленты остальных.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        limit = settings.FEED_MATERIALIZE_FOLLOWS
+        users = []
+        if limit:
+            users = list(Follow.objects.values('user').order_by().annotate(
+                follows=Count('pk')
+            ).filter(follows__gt=limit).values_list('user', flat=True))
+        with transaction.atomic():
+            FeedEntry.objects.exclude(user__in=users).delete()
+            for user_id in users:
+                rebuild_feed(user_id, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Лент подписок: {len(users)}'
+        ))
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.models import ShoppingCartTotals
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает сводные списки покупок и сверяет их '
+            'с текущим содержимым списков покупок.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только сверить, не изменяя данные.')
+
+    def compare(self):
+        """Суммы по спискам покупок и ключи расходящихся записей."""
+        live = {
+            (row['recipes__shopping_cart__user'], row['ingredients']):
+                row['amount']
+            for row in ShoppingCartTotals.objects.live_totals()
+        }
+        stored = {
+            (user, ingredient): amount
+            for user, ingredient, amount in
+            ShoppingCartTotals.objects.values_list(
+                'user_id', 'ingredients_id', 'amount'
+            )
+        }
+        mismatched = {
+            key for key in live.keys() | stored.keys()
+            if live.get(key) != stored.get(key)
+        }
+        self.stdout.write(f'Записей: {len(live)}, '
+                          f'расхождений: {len(mismatched)}')
+        return live, mismatched
+
+    def handle(self, *args, **options):
+        if options['check']:
+            _, mismatched = self.compare()
+            if mismatched:
+                raise CommandError('Сводные списки покупок расходятся '
+                                   'с содержимым списков покупок.')
+            return
+        with transaction.atomic():
+            # Блокировка ждёт транзакции, которые уже изменили сводные
+            # списки, а новые изменения откладывает до конца пересчёта:
+            # они применятся к пересчитанным суммам, а не потеряются.
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'LOCK TABLE {ShoppingCartTotals._meta.db_table} '
+                        f'IN EXCLUSIVE MODE'
+                    )
+            live, _ = self.compare()
+            ShoppingCartTotals.objects.all().delete()
+            ShoppingCartTotals.objects.bulk_create(
+                ShoppingCartTotals(user_id=user, ingredients_id=ingredient,
+                                   amount=amount)
+                for (user, ingredient), amount in live.items()
+            )
+        self.stdout.write(self.style.SUCCESS('Сводные списки пересчитаны.'))
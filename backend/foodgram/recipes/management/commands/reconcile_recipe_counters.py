@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from recipes.models import FavoriteRecipes, Recipes, ShoppingCart
+
+COUNTERS = {
+    'favorites_count': FavoriteRecipes,
+    'in_carts_count': ShoppingCart,
+}
+
+
+def live_count(model):
+    """Число записей модели-связки для каждого рецепта."""
+    return Coalesce(Subquery(
+        model.objects.filter(recipes=OuterRef('pk')).order_by().values(
+            'recipes'
+        ).annotate(total=Count('pk')).values('total')
+    ), Value(0))
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счётчики избранного и списков покупок рецептов '
+            'с фактическим числом записей и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только сверить, не изменяя данные.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def reconcile_batch(self, ids, fix):
+        """Сверяет (и при fix исправляет) счётчики рецептов ids."""
+        recipes = Recipes.objects.filter(pk__in=ids)
+        if fix:
+            # Счётчик меняется обновлением строки рецепта, поэтому
+            # изменения избранного и списков покупок, ещё не дошедшие
+            # до счётчика, ждут конца транзакции и применятся после
+            # исправления, а уже применённые видны при подсчёте.
+            list(recipes.select_for_update().order_by('pk').values_list(
+                'pk', flat=True
+            ))
+        mismatched = list(recipes.annotate(**{
+            f'live_{field}': live_count(model)
+            for field, model in COUNTERS.items()
+        }).exclude(**{
+            field: F(f'live_{field}') for field in COUNTERS
+        }).values_list('pk', flat=True))
+        if fix and mismatched:
+            Recipes.objects.filter(pk__in=mismatched).update(
+                updated_at=timezone.now(), **{
+                    field: live_count(model)
+                    for field, model in COUNTERS.items()
+                }
+            )
+        return len(mismatched)
+
+    def handle(self, *args, **options):
+        fix = not options['check']
+        ids = list(Recipes.objects.order_by('pk').values_list('pk',
+                                                              flat=True))
+        mismatched = 0
+        for start in range(0, len(ids), options['batch_size']):
+            with transaction.atomic():
+                mismatched += self.reconcile_batch(
+                    ids[start:start + options['batch_size']], fix
+                )
+        self.stdout.write(f'Рецептов с расхождениями: {mismatched}')
+        if not fix:
+            if mismatched:
+                raise CommandError('Счётчики рецептов расходятся '
+                                   'с избранным и списками покупок.')
+            return
+        self.stdout.write(self.style.SUCCESS('Счётчики рецептов исправлены.'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from recipes.search import update_search_vector
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает поисковые векторы всех рецептов.'
+
+    def handle(self, *args, **options):
+        update_search_vector()
+        self.stdout.write(self.style.SUCCESS('Поисковые векторы обновлены.'))
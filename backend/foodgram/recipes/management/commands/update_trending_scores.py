@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from recipes.trending import update_scores
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинги рецептов «в тренде» по добавлениям '
+            'в избранное и в списки покупок с момента прошлого запуска. '
+            'Рассчитан на периодический запуск (cron).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать рейтинги заново.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        updated = update_scores(options['full'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено рейтингов: {updated}'
+        ))
@@ -1,34 +1,140 @@
+import csv
 import json
 import os
+from itertools import islice
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from django.db.utils import IntegrityError
-from recipes.models import Ingredients
+from django.db import transaction
+from django.utils import timezone
+from recipes.models import Ingredients, Recipes
+from recipes.signals import ingredients_imported
 
 DATA_ROOT = os.path.join(settings.BASE_DIR, 'data')
+READ_SIZE = 64 * 1024
+
+
+def iter_csv(file):
+    """Строки CSV вида «название,единица измерения»."""
+    for row in csv.reader(file):
+        if row == ['name', 'measurement_unit']:
+            continue
+        yield dict(zip(('name', 'measurement_unit'), row))
+
+
+def iter_json(file):
+    """Элементы JSON-массива, прочитанные по частям, без загрузки файла."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив ингредиентов.')
+    buffer, eof = buffer[1:], False
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(','):
+            buffer = buffer[1:].lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError as error:
+            if eof:
+                raise CommandError('Файл JSON повреждён.') from error
+            chunk = file.read(READ_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield item if isinstance(item, dict) else {}
+        buffer = buffer[end:]
+
+
+READERS = {'csv': iter_csv, 'json': iter_json}
 
 
 class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV или JSON частями. Уже '
+            'существующие ингредиенты пропускаются или, с --update, '
+            'получают новую единицу измерения.')
 
     def add_arguments(self, parser):
         parser.add_argument('filename', default='ingredients.json', nargs='?',
                             type=str)
+        parser.add_argument('--format', choices=READERS,
+                            help='Формат файла; по умолчанию по расширению.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Число строк в одной пачке.')
+        parser.add_argument('--update', action='store_true',
+                            help='Обновлять единицы измерения существующих '
+                                 'ингредиентов.')
 
     def handle(self, *args, **options):
+        path = os.path.join(DATA_ROOT, options['filename'])
+        file_format = options['format'] or os.path.splitext(
+            path
+        )[1].lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError('Поддерживаются файлы CSV и JSON.')
+        self.counts = dict.fromkeys(
+            ('inserted', 'updated', 'skipped', 'invalid'), 0
+        )
+        self.updated_ids = []
         try:
-            with open(os.path.join(DATA_ROOT, options['filename']), 'r',
-                      encoding='utf-8') as f:
-                data = json.load(f)
-                for ingredient in data:
-                    try:
-                        Ingredients.objects.create(name=ingredient["name"],
-                                                   measurement_unit=ingredient[
-                                                   "measurement_unit"])
-                    except IntegrityError:
-                        print(f'Ингредиент {ingredient["name"]} '
-                              f'{ingredient["measurement_unit"]} '
-                              f'Ингредиент уже добавлен')
-
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                rows = READERS[file_format](f)
+                while True:
+                    batch = list(islice(rows, options['batch_size']))
+                    if not batch:
+                        break
+                    self.import_batch(batch, options['update'])
         except FileNotFoundError:
             raise CommandError('Файл отсутствует')
+        if self.updated_ids:
+            Recipes.objects.filter(
+                ingredients__ingredients__in=self.updated_ids
+            ).update(updated_at=timezone.now())
+        if self.counts['inserted'] or self.updated_ids:
+            ingredients_imported.send(sender=Ingredients)
+        self.stdout.write(self.style.SUCCESS(
+            'Добавлено: {inserted}, обновлено: {updated}, '
+            'пропущено: {skipped}, с ошибками: {invalid}'.format(
+                **self.counts
+            )
+        ))
+
+    def import_batch(self, batch, update):
+        name_length = Ingredients._meta.get_field('name').max_length
+        unit_length = Ingredients._meta.get_field(
+            'measurement_unit'
+        ).max_length
+        units = {}
+        for row in batch:
+            name = str(row.get('name') or '').strip()
+            unit = str(row.get('measurement_unit') or '').strip()
+            if not (0 < len(name) <= name_length
+                    and 0 < len(unit) <= unit_length):
+                self.counts['invalid'] += 1
+                continue
+            if name in units:
+                self.counts['skipped'] += 1
+            units[name] = unit
+        with transaction.atomic():
+            existing = Ingredients.objects.filter(
+                name__in=units
+            ).only('id', 'name', 'measurement_unit')
+            changed = []
+            for ingredient in existing:
+                unit = units.pop(ingredient.name)
+                if not update or ingredient.measurement_unit == unit:
+                    self.counts['skipped'] += 1
+                    continue
+                ingredient.measurement_unit = unit
+                changed.append(ingredient)
+            Ingredients.objects.bulk_update(changed, ['measurement_unit'])
+            # ignore_conflicts пропускает строки, добавленные параллельно.
+            Ingredients.objects.bulk_create((
+                Ingredients(name=name, measurement_unit=unit)
+                for name, unit in units.items()
+            ), ignore_conflicts=True)
+        self.counts['inserted'] += len(units)
+        self.counts['updated'] += len(changed)
+        self.updated_ids += [ingredient.pk for ingredient in changed]
@@ -1,7 +1,18 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import (Case, Exists, F, IntegerField, OuterRef,
+                              Prefetch, Sum, Value, When)
+from django.db.models.functions import Greatest
+from django.utils import timezone
 from users.models import User
 
+from .storage import recipes_image_storage
+
+# Порядок «популярные»: по избранному, спискам покупок и новизне.
+POPULAR_ORDERING = ('-favorites_count', '-in_carts_count', '-pub_date', '-id')
+
 
 class Ingredients(models.Model):
     """Модель хранения ингредиентов."""
@@ -50,6 +61,61 @@ class Tags(models.Model):
         return self.name
 
 
+class SearchVectorIndex(GinIndex):
+    """GIN-индекс в PostgreSQL, обычный индекс в остальных СУБД."""
+    def create_sql(self, model, schema_editor, using=''):
+        if schema_editor.connection.vendor != 'postgresql':
+            return models.Index.create_sql(self, model, schema_editor, using)
+        return super().create_sql(model, schema_editor, using)
+
+
+class RecipesQuerySet(models.QuerySet):
+    """Набор запросов для рецептов."""
+    def with_related(self):
+        """
+        Подгружает автора, теги и ингредиенты рецептов
+        фиксированным числом запросов. Поисковый вектор в ответах
+        не нужен и не загружается.
+        """
+        return self.defer('search_vector').select_related(
+            'author'
+        ).prefetch_related(
+            Prefetch('tags', queryset=Tags.objects.all()),
+            Prefetch(
+                'ingredients',
+                queryset=IngredientsForRecipes.objects.select_related(
+                    'ingredients'
+                )
+            )
+        )
+
+    def annotate_user_flags(self, user):
+        """
+        Добавляет признаки вхождения рецепта в избранное
+        и в список покупок пользователя.
+        """
+        if user.is_anonymous:
+            return self
+        return self.annotate(
+            is_favorited=Exists(FavoriteRecipes.objects.filter(
+                user=user, recipes=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipes=OuterRef('pk')
+            ))
+        )
+
+    def change_counter(self, field, delta):
+        """
+        Атомарно изменяет счётчик (favorites_count, in_carts_count)
+        на delta, не опуская его ниже нуля.
+        """
+        return self.update(**{
+            field: Greatest(F(field) + delta, Value(0)),
+            'updated_at': timezone.now(),
+        })
+
+
 class Recipes(models.Model):
     """Модель хранения рецептов."""
     author = models.ForeignKey(
@@ -64,7 +130,13 @@ class Recipes(models.Model):
     )
     image = models.ImageField(
         'Картинка',
-        upload_to='recipes/'
+        upload_to='recipes/',
+        storage=recipes_image_storage
+    )
+    images_ready = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Уменьшенные копии построены'
     )
     text = models.TextField(
         verbose_name='Описание',
@@ -87,11 +159,44 @@ class Recipes(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+
+    objects = RecipesQuerySet.as_manager()
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipes_pub_date_id_idx'),
+            models.Index(fields=list(POPULAR_ORDERING),
+                         name='recipes_popular_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='recipes_author_pub_date_idx'),
+            models.Index(fields=['updated_at'],
+                         name='recipes_updated_at_idx'),
+            SearchVectorIndex(fields=['search_vector'],
+                              name='recipes_search_vector_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -118,6 +223,12 @@ class IngredientsForRecipes(models.Model):
     class Meta():
         verbose_name = 'Ингредиент для рецепта'
         verbose_name_plural = 'Ингредиенты для рецептов'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipes', 'ingredients'],
+                name='unique_recipe_ingredient'
+            )
+        ]
 
     def __str__(self):
         return f'Рецепт: {self.recipes}, Ингредиенты: {self.ingredients} '
@@ -137,11 +248,22 @@ class FavoriteRecipes(models.Model):
         related_name='favorite',
         verbose_name='Рецепты'
     )
+    created = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta():
         ordering = ('-id',)
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipes'],
+                name='unique_favorite_recipes'
+            )
+        ]
 
     def __str__(self):
         return 'Избранные рецепты'
@@ -161,15 +283,196 @@ class ShoppingCart(models.Model):
         related_name='shopping_cart',
         verbose_name='Рецепт'
     )
+    created = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta():
         ordering = ('-id',)
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
-        models.UniqueConstraint(
-            fields=['user', 'recipes'],
-            name='unique_together'
-        )
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipes'],
+                name='unique_shopping_cart'
+            )
+        ]
 
     def __str__(self):
         return f'Cписок покупок {self.user}'
+
+
+class RecipeScore(models.Model):
+    """
+    Рейтинг рецепта для выдачи «в тренде»: натуральный логарифм суммы
+    весов добавлений в избранное и в списки покупок, экспоненциально
+    растущих со временем добавления. Сравнение таких значений
+    равносильно сравнению затухающих со временем сумм.
+    """
+    recipes = models.OneToOneField(
+        Recipes,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Рецепт'
+    )
+    score = models.FloatField('Рейтинг')
+
+    class Meta():
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = [
+            models.Index(fields=['-score'], name='recipe_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipes}: {self.score}'
+
+
+class TrendingWatermark(models.Model):
+    """Время, по которое добавления уже учтены в рейтингах рецептов."""
+    processed_until = models.DateTimeField(
+        'Учтено по',
+        null=True
+    )
+
+    class Meta():
+        verbose_name = 'Отметка пересчёта рейтингов'
+        verbose_name_plural = 'Отметки пересчёта рейтингов'
+
+    def __str__(self):
+        return f'{self.processed_until}'
+
+
+class FeedEntry(models.Model):
+    """
+    Рецепт в ленте подписок пользователя. Ленты хранятся только для
+    пользователей с большим числом подписок (FEED_MATERIALIZE_FOLLOWS).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пользователь'
+    )
+    recipes = models.ForeignKey(
+        Recipes,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta():
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipes'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipes'],
+                         name='feed_entry_user_pub_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.recipes}'
+
+
+class ShoppingCartTotalsManager(models.Manager):
+    """Инкрементальное обновление сводного списка покупок."""
+    def _recipes_amounts(self, recipes):
+        return dict(IngredientsForRecipes.objects.filter(
+            recipes__in=recipes
+        ).values('ingredients').annotate(
+            total=Sum('amount')
+        ).values_list('ingredients', 'total'))
+
+    def _apply(self, user_ids, deltas):
+        """Изменяет количество ингредиентов у всех указанных пользователей."""
+        deltas = {key: value for key, value in deltas.items() if value}
+        if not user_ids or not deltas:
+            return
+        self.bulk_create([
+            self.model(user_id=user_id, ingredients_id=ingredient, amount=0)
+            for user_id in user_ids
+            for ingredient, delta in deltas.items() if delta > 0
+        ], ignore_conflicts=True)
+        totals = self.filter(user_id__in=user_ids, ingredients__in=deltas)
+        totals.update(amount=F('amount') + Case(
+            *(When(ingredients=ingredient, then=Value(delta))
+              for ingredient, delta in deltas.items()),
+            default=Value(0),
+            output_field=IntegerField()
+        ))
+        totals.filter(amount__lte=0).delete()
+
+    def add_recipes(self, user, recipes):
+        self._apply([user.id], self._recipes_amounts(recipes))
+
+    def remove_recipes(self, user, recipes):
+        self._apply([user.id], {
+            ingredient: -amount for ingredient, amount
+            in self._recipes_amounts(recipes).items()
+        })
+
+    def change_recipe(self, recipes, deltas):
+        """Учитывает изменение ингредиентов рецепта в списках покупок."""
+        if not deltas:
+            return
+        self._apply(list(ShoppingCart.objects.filter(
+            recipes=recipes
+        ).values_list('user_id', flat=True)), deltas)
+
+    def discard_recipe(self, recipes):
+        """Убирает рецепт из сводных списков перед его удалением."""
+        self.change_recipe(recipes, {
+            ingredient: -amount for ingredient, amount
+            in self._recipes_amounts([recipes]).items()
+        })
+
+    def live_totals(self):
+        """Суммы, рассчитанные по текущему содержимому списков покупок."""
+        return IngredientsForRecipes.objects.filter(
+            recipes__shopping_cart__isnull=False
+        ).values(
+            'recipes__shopping_cart__user', 'ingredients'
+        ).order_by().annotate(amount=Sum('amount'))
+
+
+class ShoppingCartTotals(models.Model):
+    """Сводное количество ингредиентов в списке покупок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+        verbose_name='Пользователь'
+    )
+    ingredients = models.ForeignKey(
+        Ingredients,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+        verbose_name='Ингредиент'
+    )
+    amount = models.IntegerField(
+        'Количество'
+    )
+
+    objects = ShoppingCartTotalsManager()
+
+    class Meta():
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredients'],
+                name='unique_shopping_cart_totals'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredients} - {self.amount}'
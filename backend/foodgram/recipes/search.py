@@ -0,0 +1,141 @@
+"""
+Полнотекстовый поиск рецептов по названию, ингредиентам и описанию.
+
+В PostgreSQL используется хранимый tsvector с GIN-индексом. Для других
+СУБД (SQLite при разработке) строится обратный индекс в памяти процесса.
+"""
+import heapq
+import re
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import (Case, F, FloatField, OuterRef, Subquery,
+                              TextField, Value, When)
+from django.db.models.functions import Cast
+
+from .models import IngredientsForRecipes, Recipes
+
+WEIGHTS = {'A': 1.0, 'B': 0.4, 'C': 0.2}
+TOKEN_RE = re.compile(r'\w+')
+# Каждый найденный рецепт добавляет в запрос до пяти параметров (запрос
+# числа рецептов повторяет ранг в GROUP BY), а SQLite по умолчанию
+# принимает не больше 999; менее релевантные рецепты отбрасываются.
+INDEX_RESULTS_LIMIT = 150
+
+
+def _is_postgresql():
+    return connection.vendor == 'postgresql'
+
+
+def _tokenize(text):
+    return TOKEN_RE.findall(text.casefold())
+
+
+class RecipesInvertedIndex:
+    """
+    Обратный индекс «слово -> рецепты» для СУБД
+    без полнотекстового поиска.
+    """
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._data = None
+
+    def _load(self):
+        postings = defaultdict(lambda: defaultdict(float))
+        for pk, name, text in Recipes.objects.values_list(
+            'pk', 'name', 'text'
+        ).iterator():
+            for token in _tokenize(name):
+                postings[token][pk] += WEIGHTS['A']
+            for token in _tokenize(text):
+                postings[token][pk] += WEIGHTS['C']
+        for pk, name in IngredientsForRecipes.objects.values_list(
+            'recipes_id', 'ingredients__name'
+        ).iterator():
+            for token in _tokenize(name):
+                postings[token][pk] += WEIGHTS['B']
+        self._data = (sorted(postings), postings, time.monotonic())
+        return self._data
+
+    def _get(self):
+        data = self._data
+        if data is not None and not (
+            self.ttl and time.monotonic() - data[2] > self.ttl
+        ):
+            return data
+        return self._load()
+
+    def invalidate(self):
+        self._data = None
+
+    def search(self, query):
+        """Рецепты, содержащие все слова запроса (по началу слова)."""
+        tokens, postings, _ = self._get()
+        scores = None
+        for word in _tokenize(query):
+            word_scores = defaultdict(float)
+            position = bisect_left(tokens, word)
+            while (position < len(tokens)
+                   and tokens[position].startswith(word)):
+                for pk, weight in postings[tokens[position]].items():
+                    word_scores[pk] += weight
+                position += 1
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {pk: score + word_scores[pk]
+                          for pk, score in scores.items()
+                          if pk in word_scores}
+        return scores or {}
+
+
+recipes_index = RecipesInvertedIndex(ttl=settings.RECIPES_INDEX_TTL)
+
+
+def update_search_vector(*recipes_ids):
+    """Пересчитывает поисковый вектор рецептов после их изменения."""
+    if not _is_postgresql():
+        recipes_index.invalidate()
+        return
+    from django.contrib.postgres.aggregates import StringAgg
+
+    config = settings.RECIPES_SEARCH_CONFIG
+    ingredients = IngredientsForRecipes.objects.filter(
+        recipes=OuterRef('pk')
+    ).order_by().values('recipes').annotate(
+        names=StringAgg('ingredients__name', ' ')
+    ).values('names')
+    recipes = Recipes.objects.all()
+    if recipes_ids:
+        recipes = recipes.filter(pk__in=recipes_ids)
+    recipes.update(search_vector=(
+        SearchVector('name', weight='A', config=config)
+        + SearchVector(Subquery(ingredients, output_field=TextField()),
+                       weight='B', config=config)
+        + SearchVector('text', weight='C', config=config)
+    ))
+
+
+def search_recipes(queryset, query):
+    """Отбирает рецепты по запросу и упорядочивает их по релевантности."""
+    if _is_postgresql():
+        search_query = SearchQuery(query,
+                                   config=settings.RECIPES_SEARCH_CONFIG)
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), search_query),
+                      FloatField())
+        ).order_by('-rank', '-pub_date')
+    scores = dict(heapq.nlargest(
+        INDEX_RESULTS_LIMIT, recipes_index.search(query).items(),
+        key=lambda item: item[1]
+    ))
+    return queryset.filter(pk__in=scores).annotate(rank=Case(
+        *(When(pk=pk, then=Value(score)) for pk, score in scores.items()),
+        default=Value(0.0),
+        output_field=FloatField()
+    )).order_by('-rank', '-pub_date')
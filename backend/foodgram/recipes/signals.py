@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Ингредиенты добавлены или изменены массово, без post_save.
+ingredients_imported = Signal()
@@ -0,0 +1,54 @@
+"""
+Хранилище изображений рецептов с адресацией по содержимому.
+
+Имя файла — SHA-256 его содержимого, поэтому одинаковые изображения
+хранятся один раз, а повторная загрузка того же файла ничего не пишет.
+Файлы не удаляются вместе с рецептами: один файл может использоваться
+несколькими рецептами, неиспользуемые удаляет команда
+collect_recipe_images.
+"""
+import hashlib
+import os
+import posixpath
+from collections import Counter
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, называющее файлы по хэшу содержимого."""
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory, basename = posixpath.split(name)
+        extension = os.path.splitext(basename)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # Обновляем дату изменения, чтобы сборка мусора не удалила
+            # файл, пока ссылающийся на него рецепт ещё не сохранён.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+
+def image_references(recipes):
+    """Число рецептов, ссылающихся на каждый файл изображения."""
+    return Counter(
+        recipes.exclude(image='').values_list('image', flat=True).iterator()
+    )
+
+
+recipes_image_storage = ContentAddressedStorage()
@@ -0,0 +1,117 @@
+"""
+Рейтинг рецептов «в тренде».
+
+Каждое добавление рецепта в избранное или в список покупок даёт вклад
+weight * 2 ** ((created - EPOCH) / half_life): чем новее добавление,
+тем больше вклад, поэтому старая активность относительно затухает.
+Чтобы не переполнять float, храним натуральный логарифм суммы вкладов.
+Рейтинг считается только по существующим записям. Инкрементальный
+пересчёт заново суммирует вклады рецептов, изменившихся после отметки
+предыдущего запуска: с новыми записями или изменённой датой рецепта
+(счётчики избранного и списков покупок меняют её и при удалении).
+Поэтому удаление уменьшает рейтинг, и результат совпадает с полным
+пересчётом.
+"""
+import math
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (FavoriteRecipes, Recipes, RecipeScore, ShoppingCart,
+                     TrendingWatermark)
+
+EPOCH = datetime(2022, 1, 1, tzinfo=timezone.utc)
+WEIGHTS = ((FavoriteRecipes, 1.0), (ShoppingCart, 0.5))
+# Записи, добавленные в ещё не завершённых транзакциях, могут получить
+# время раньше момента пересчёта, поэтому последние секунды не берём.
+LAG = timedelta(seconds=30)
+
+
+def event_score(created, weight):
+    """Логарифм вклада одного добавления."""
+    half_life = settings.TRENDING_HALF_LIFE_HOURS * 3600
+    age = (created - EPOCH).total_seconds()
+    return math.log(weight) + age / half_life * math.log(2)
+
+
+def log_add(first, second):
+    """Логарифм суммы по логарифмам слагаемых."""
+    if first is None:
+        return second
+    high, low = max(first, second), min(first, second)
+    return high + math.log1p(math.exp(low - high))
+
+
+def collect_scores(until, recipes_ids=None):
+    """
+    Логарифмы сумм вкладов добавлений по until включительно
+    по рецептам recipes_ids (по всем, если не заданы).
+    """
+    scores = {}
+    for model, weight in WEIGHTS:
+        events = model.objects.filter(created__lte=until)
+        if recipes_ids is not None:
+            events = events.filter(recipes__in=recipes_ids)
+        for recipes_id, created in events.values_list(
+            'recipes_id', 'created'
+        ).order_by().iterator():
+            scores[recipes_id] = log_add(scores.get(recipes_id),
+                                         event_score(created, weight))
+    return scores
+
+
+def changed_recipes(since):
+    """Рецепты, добавления которых могли измениться после since."""
+    changed = set(Recipes.objects.filter(
+        updated_at__gt=since
+    ).values_list('pk', flat=True))
+    for model, _ in WEIGHTS:
+        changed.update(model.objects.filter(
+            created__gt=since
+        ).values_list('recipes_id', flat=True))
+    return sorted(changed)
+
+
+def save_scores(scores, recipes_ids, batch_size):
+    """Записывает рейтинги рецептов recipes_ids; без добавлений — удаляет."""
+    RecipeScore.objects.filter(recipes__in=recipes_ids).exclude(
+        recipes__in=list(scores)
+    ).delete()
+    existing = RecipeScore.objects.in_bulk(list(scores))
+    for recipes_id, score in existing.items():
+        score.score = scores.pop(recipes_id)
+    RecipeScore.objects.bulk_update(existing.values(), ['score'],
+                                    batch_size=batch_size)
+    RecipeScore.objects.bulk_create((
+        RecipeScore(recipes_id=recipes_id, score=score)
+        for recipes_id, score in scores.items()
+    ), batch_size=batch_size)
+    return len(existing) + len(scores)
+
+
+def update_scores(full=False, batch_size=500):
+    """
+    Пересчитывает рейтинги рецептов, изменившихся после отметки
+    прошлого пересчёта. С full=True рейтинги пересчитываются заново.
+    Возвращает число рецептов с рейтингом, записанным заново.
+    """
+    until = timezone.now() - LAG
+    with transaction.atomic():
+        watermark = TrendingWatermark.objects.select_for_update().filter(
+            pk=1
+        ).first() or TrendingWatermark.objects.create(pk=1)
+        if full or watermark.processed_until is None:
+            RecipeScore.objects.all().delete()
+            updated = save_scores(collect_scores(until), [], batch_size)
+        else:
+            updated = 0
+            changed = changed_recipes(watermark.processed_until)
+            for start in range(0, len(changed), batch_size):
+                batch = changed[start:start + batch_size]
+                updated += save_scores(collect_scores(until, batch), batch,
+                                       batch_size)
+        watermark.processed_until = until
+        watermark.save(update_fields=['processed_until'])
+    return updated
@@ -50,6 +50,21 @@ class User(AbstractUser):
         default=USER,
         verbose_name='Роль',
     )
+    favorites_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Версия избранного',
+    )
+    shopping_cart_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Версия списка покупок',
+    )
+    follows_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Версия подписок',
+    )
 
     class Meta:
         ordering = ('-id',)
@@ -93,7 +108,7 @@ class Follow(models.Model):
         verbose_name_plural = 'Подписки'
         constraints = [
             models.UniqueConstraint(
-                fields=['user', 'author'], name='unique_together'
+                fields=['user', 'author'], name='unique_follow'
             )
         ]
 
@@ -1,10 +1,25 @@
 from djoser.serializers import UserCreateSerializer
+from recipes.images import rendition_urls
 from recipes.models import Recipes
 from rest_framework import serializers
 
 from .models import Follow, User
 
 
+def get_followed_authors(request):
+    """
+    Возвращает id авторов, на которых подписан пользователь.
+    Подписки загружаются один раз за запрос.
+    """
+    if not hasattr(request, 'followed_authors'):
+        request.followed_authors = set(
+            Follow.objects.filter(user=request.user).values_list(
+                'author_id', flat=True
+            )
+        )
+    return request.followed_authors
+
+
 class CustomCreateUserSerializer(UserCreateSerializer):
     """Сериализатор создания пользователя."""
     class Meta:
@@ -53,23 +68,29 @@ class CustomUserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
+        request = self.context.get('request')
+        if request.user.is_anonymous:
             return False
-        return Follow.objects.filter(user=user, author=obj.id).exists()
+        return obj.id in get_followed_authors(request)
 
 
 class FollowRecipesSerializer(serializers.ModelSerializer):
     """Сериализатор подписок на рецепты."""
+    images = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipes
         fields = (
             'id',
             'name',
             'image',
+            'images',
             'cooking_time'
         )
 
+    def get_images(self, obj):
+        return rendition_urls(obj, self.context.get('request'))
+
 
 class FollowUsersSerializer(serializers.ModelSerializer):
     """Сериализатор подписок на пользователя."""
@@ -96,18 +117,22 @@ class FollowUsersSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
+        request = self.context.get('request')
+        if request.user.is_anonymous:
             return False
-        return Follow.objects.filter(user=user, author=obj.id).exists()
+        return obj.author_id in get_followed_authors(request)
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = request.GET.get('recipes_limit')
-        queryset = Recipes.objects.filter(author=obj.author)
-        if recipes_limit:
-            queryset = queryset[:int(recipes_limit)]
+        queryset = getattr(obj.author, 'recent_recipes', None)
+        if queryset is None:
+            request = self.context.get('request')
+            recipes_limit = request.GET.get('recipes_limit')
+            queryset = Recipes.objects.filter(author=obj.author)
+            if recipes_limit:
+                queryset = queryset[:int(recipes_limit)]
         return FollowRecipesSerializer(queryset, many=True).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return Recipes.objects.filter(author=obj.author).count()
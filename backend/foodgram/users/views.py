@@ -1,6 +1,9 @@
+from api.mixins import ConditionalGetMixin
 from api.pagination import CustomPageNumberPagination
 from api.permissions import AuthorAdminOrReadOnly
+from django.db.models import Count, OuterRef, Prefetch, Subquery
 from djoser.views import UserViewSet
+from recipes.models import Recipes
 from rest_framework import permissions, status
 from rest_framework.decorators import action
 from rest_framework.generics import get_object_or_404
@@ -9,16 +12,48 @@ from users.models import Follow, User
 from users.serializers import FollowUsersSerializer
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(ConditionalGetMixin, UserViewSet):
     """
     Обрабатывает запросы к странице пользователя.
     """
     pagination_class = CustomPageNumberPagination
     permission_classes = (AuthorAdminOrReadOnly,)
 
+    def get_subscriptions_queryset(self):
+        """
+        Подписки пользователя с количеством рецептов авторов
+        и последними рецептами (не более recipes_limit на автора).
+        """
+        recipes = Recipes.objects.all()
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipes.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:int(recipes_limit)]
+            ))
+        return Follow.objects.filter(
+            user=self.request.user
+        ).select_related('author').annotate(
+            recipes_count=Count('author__recipies')
+        ).prefetch_related(
+            Prefetch('author__recipies', queryset=recipes,
+                     to_attr='recent_recipes')
+        )
+
+    def get_subscriptions_stamps(self):
+        # Подписки пользователя учтены в follows_version (отметки
+        # пользователя), рецепты авторов — в общих отметках рецептов.
+        return (None, *self.get_recipes_stamps())
+
     @action(detail=False, permission_classes=[permissions.IsAuthenticated])
     def subscriptions(self, request):
-        queryset = Follow.objects.filter(user=request.user)
+        return self.conditional_response(
+            self.get_subscriptions_stamps(), self.list_subscriptions, request
+        )
+
+    def list_subscriptions(self, request):
+        queryset = self.get_subscriptions_queryset()
         page = self.paginate_queryset(queryset)
         serializer = FollowUsersSerializer(
             page, many=True,
@@ -37,10 +72,9 @@ class CustomUserViewSet(UserViewSet):
             ).exists():
                 return Response('Ошибка подписки',
                                 status=status.HTTP_400_BAD_REQUEST)
-            Follow.objects.create(user=user, author=author)
-            queryset = Follow.objects.get(user=request.user, author=author)
+            follow = Follow.objects.create(user=user, author=author)
             serializer = FollowUsersSerializer(
-                queryset,
+                follow,
                 context={'request': request}
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)